@@ -3,8 +3,8 @@
 处理印花税、手续费、T+1 限制等交易规则
 """
 import backtrader as bt
-from datetime import datetime, timedelta
-from typing import Dict, Optional
+from datetime import date
+from typing import Any, Dict, Tuple
 
 
 class ChinaStockBroker(bt.brokers.BackBroker):
@@ -32,12 +32,20 @@ class ChinaStockBroker(bt.brokers.BackBroker):
         - min_commission: 最小手续费（默认 5.0 元）
         """
         super().__init__(**kwargs)
+        # commission 与 BrokerBase 的参数同名，backtrader 的参数机制在 __init__ 之前就把传入的费率
+        # 取走作为 p.commission（应为 CommInfo 对象），此时这里收到的只是默认值：取回费率并恢复默认 CommInfo
+        if not isinstance(self.p.commission, bt.CommInfoBase):
+            commission = self.p.commission
+            self.p.commission = bt.CommInfoBase(percabs=True)
+            self.comminfo = {None: self.p.commission}
         self.commission_rate = commission
         self.stamp_tax_rate = stamp_tax
         self.min_commission = min_commission
         
-        # 记录每笔买入的日期，用于 T+1 限制
-        self._buy_dates: Dict[int, datetime] = {}  # {order_id: buy_date}
+        # 按数据源记录各交易日买入成交的数量，用于 T+1 限制 {data: {date: size}}
+        self._position_buy_sizes: Dict[Any, Dict[date, float]] = {}
+        # 按数据源缓存当前 K 线的日期 {data: (bar_len, date)}，同一根 K 线上的多笔订单只转换一次
+        self._bar_dates: Dict[Any, Tuple[int, date]] = {}
     
     def get_commission_info(self, size: float, price: float, is_buy: bool) -> Dict[str, float]:
         """
@@ -68,103 +76,57 @@ class ChinaStockBroker(bt.brokers.BackBroker):
             'total_cost': total_cost
         }
     
-    def submit(self, order):
+    def submit(self, order, check=True):
         """提交订单前检查 T+1 限制"""
-        # 如果是卖出订单，检查是否违反 T+1 规则
-        if order.isbuy():
-            # 买入订单：记录买入日期
-            self._buy_dates[order.ref] = self.data.datetime.date(0)
-        else:
-            # 卖出订单：检查持仓是否满足 T+1
-            if self._check_t1_restriction(order):
-                # 违反 T+1，拒绝订单
-                order.reject()
-                return order
-        
-        return super().submit(order)
+        # 卖出订单：检查可卖数量是否满足 T+1
+        if order.issell() and self._check_t1_restriction(order):
+            # 违反 T+1，拒绝订单
+            order.reject(self)
+            self.notify(order)
+            return order
+        
+        return super().submit(order, check=check)
     
     def _check_t1_restriction(self, order) -> bool:
         """
         检查是否违反 T+1 限制
         
+        可卖数量 = 总持仓 - 当天买入成交的数量
+        
         返回 True 表示违反 T+1（不能卖出），False 表示可以卖出
         """
         # 获取当前持仓
         position = self.getposition(order.data)
         
-        if position.size == 0:
-            # 没有持仓，可以卖出（做空场景，但A股不支持做空）
+        if position.size <= 0:
+            # 没有持仓，不做 T+1 限制（做空场景，但A股不支持做空）
             return False
         
-        # 检查是否有今天买入的股票
-        current_date = self.data.datetime.date(0)
-        
-        # 简化处理：如果持仓存在且是今天买入的，则不能卖出
-        # 注意：这里简化了，实际应该跟踪每笔买入的日期
-        # 更精确的实现需要维护持仓成本记录
+        current_date = self._current_date(order.data)
+        today_bought = self._position_buy_sizes.get(order.data, {}).get(current_date, 0)
         
-        # 对于简化版本，我们假设：
-        # 如果今天有买入订单，则不能卖出
-        for order_ref, buy_date in self._buy_dates.items():
-            if buy_date == current_date:
-                # 今天有买入，不能卖出
-                return True
-        
-        return False
+        return position.size - today_bought < abs(order.size)
     
-    def notify_order(self, order):
-        """订单状态通知"""
-        if order.status in [order.Completed]:
-            if order.isbuy():
-                # 买入完成，记录日期
-                self._buy_dates[order.ref] = self.data.datetime.date(0)
-            elif order.issell():
-                # 卖出完成，清理记录（简化处理）
-                pass
-        
-        super().notify_order(order)
-
-
-class T1Broker(bt.brokers.BackBroker):
-    """
-    T+1 限制的 Broker 包装器
-    
-    这是一个更精确的 T+1 实现，通过自定义 Order 来跟踪买入日期
-    """
-    
-    def __init__(self, **kwargs):
-        super().__init__(**kwargs)
-        # 记录持仓的买入日期 {data: {date: size}}
-        self._position_buy_dates: Dict = {}
+    def _current_date(self, data) -> date:
+        """获取数据源当前 K 线的日期（每根 K 线只调用一次 num2date）"""
+        bar_len = len(data)
+        cached = self._bar_dates.get(data)
+        if cached is None or cached[0] != bar_len:
+            cached = (bar_len, data.datetime.date(0))
+            self._bar_dates[data] = cached
+        return cached[1]
     
-    def _check_can_sell(self, data, size: int) -> bool:
-        """
-        检查是否可以卖出指定数量的股票
-        
-        参数:
-        - data: 数据源
-        - size: 要卖出的数量（正数）
-        
-        返回:
-        - True: 可以卖出
-        - False: 不能卖出（违反 T+1）
-        """
-        if data not in self._position_buy_dates:
-            return True
-        
-        position = self.getposition(data)
-        if position.size <= 0:
-            return True
-        
-        current_date = data.datetime.date(0)
-        
-        # 检查今天买入的股票数量
-        today_buy_size = self._position_buy_dates[data].get(current_date, 0)
-        
-        # 可以卖出的数量 = 总持仓 - 今天买入的数量
-        available_size = position.size - today_buy_size
-        
-        return available_size >= size
+    def notify(self, order):
+        """订单状态通知：买入成交时按成交日期累计买入数量"""
+        if order.status == order.Completed and order.isbuy():
+            buy_date = bt.num2date(order.executed.dt).date()
+            buy_sizes = self._position_buy_sizes.setdefault(order.data, {})
+            if buy_date not in buy_sizes:
+                # 进入新的交易日，清理更早的记录，只有当天的买入数量会影响 T+1
+                buy_sizes.clear()
+            buy_sizes[buy_date] = buy_sizes.get(buy_date, 0) + order.executed.size
+        
+        super().notify(order)
 
 
 def create_china_stock_broker(
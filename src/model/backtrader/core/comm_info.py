@@ -2,6 +2,37 @@
 自定义手续费和印花税计算
 """
 import backtrader as bt
+import numpy as np
+
+from utils._njit import njit
+
+
+@njit(cache=True)
+def _fees_kernel(sizes, prices, commission, stamp_tax, min_commission):
+    """批量费用计算内核：手续费（不低于最小值）+ 卖出印花税"""
+    value = np.abs(sizes) * prices
+    comm = np.maximum(value * commission, min_commission)
+    tax = np.where(sizes < 0, value * stamp_tax, 0.0)
+    return comm + tax
+
+
+def compute_fees(sizes, prices, commission=0.0003, stamp_tax=0.001, min_commission=5.0) -> np.ndarray:
+    """
+    批量计算多笔成交的总费用（手续费 + 印花税）
+    
+    参数:
+    - sizes: 成交数量数组（正数=买入，负数=卖出）
+    - prices: 成交价格数组（与 sizes 等长）
+    - commission: 手续费率
+    - stamp_tax: 印花税率（仅卖出时收取）
+    - min_commission: 最小手续费
+    
+    返回:
+    每笔成交的总费用数组
+    """
+    sizes = np.ascontiguousarray(sizes, dtype=np.float64)
+    prices = np.ascontiguousarray(prices, dtype=np.float64)
+    return _fees_kernel(sizes, prices, float(commission), float(stamp_tax), float(min_commission))
 
 
 class ChinaStockCommInfo(bt.CommInfoBase):
@@ -23,6 +54,29 @@ class ChinaStockCommInfo(bt.CommInfoBase):
         ('percabs', True),            # commission 是绝对小数（不是百分比）
     )
     
+    def __init__(self):
+        super().__init__()
+        # 缓存费率参数，避免每笔成交都经过 self.p 的参数查找
+        self._commission_rate = float(self.p.commission)
+        self._stamp_tax_rate = float(self.p.stamp_tax)
+        self._min_commission = float(self.p.min_commission)
+    
+    @classmethod
+    def compute_fees_batch(cls, sizes, prices,
+                           commission=None, stamp_tax=None, min_commission=None) -> np.ndarray:
+        """
+        批量计算费用（向量化路径，用于一次性估算大量成交的费用）
+        
+        未指定的费率参数使用类默认参数
+        """
+        defaults = dict(cls.params._getitems())
+        return compute_fees(
+            sizes, prices,
+            defaults['commission'] if commission is None else commission,
+            defaults['stamp_tax'] if stamp_tax is None else stamp_tax,
+            defaults['min_commission'] if min_commission is None else min_commission,
+        )
+    
     def _getcommission(self, size, price, pseudoexec):
         """
         计算总费用（手续费 + 印花税）
@@ -37,24 +91,9 @@ class ChinaStockCommInfo(bt.CommInfoBase):
         """
         value = abs(size) * price
         
-        # 计算手续费
-        commission = value * self.p.commission
-        
-        # 应用最小手续费（手续费不能小于最小值）
-        if commission < self.p.min_commission:
-            commission = self.p.min_commission
-        
-        # 印花税（仅卖出时收取）
-        stamp_tax = 0.0
-        if size < 0:  # 卖出
-            stamp_tax = value * self.p.stamp_tax
-        
-        # 返回总费用
-        total_cost = commission + stamp_tax
-        
-        # 调试信息（可选，生产环境可关闭）
-        # if not pseudoexec:
-        #     print(f"费用计算: size={size}, price={price:.2f}, value={value:.2f}, "
-        #           f"commission={commission:.2f}, stamp_tax={stamp_tax:.2f}, total={total_cost:.2f}")
+        # 计算手续费（不能小于最小手续费）
+        commission = value * self._commission_rate
+        commission = commission if commission >= self._min_commission else self._min_commission
         
-        return total_cost
+        # 印花税（仅卖出时收取）：(size < 0) 取值 0/1，用乘法代替分支
+        return commission + value * self._stamp_tax_rate * (size < 0)
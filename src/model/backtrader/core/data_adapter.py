@@ -1,10 +1,353 @@
 """
 数据适配器：将项目数据格式转换为 Backtrader 格式
 """
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
 import pandas as pd
+import pyarrow.parquet as pq
 import backtrader as bt
 from utils.stock_data import get_stock_data
-from typing import Optional
+from typing import List, Optional
+
+
+# 区间缓存目录：{RANGE_CACHE_DIR}/{symbol}/{frequency}_{start}_{end}_{adjust_flag}.parquet
+RANGE_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'stock_models')
+
+# 进程内区间缓存的最大条目数（同一进程内重复回测直接复用，不再读取 Parquet）
+MEMORY_CACHE_SIZE = 64
+_memory_cache: "OrderedDict[str, pd.DataFrame]" = OrderedDict()
+_memory_cache_lock = threading.Lock()
+
+# Backtrader 数据源使用的列
+OHLCV_COLUMNS = ['open', 'high', 'low', 'close', 'volume']
+
+# 可由 5 分钟线聚合得到的分钟线频率
+DERIVED_MINUTE_FREQUENCIES = ("15", "30", "60")
+
+# A股交易时段（分钟）：上午 9:30-11:30，下午 13:00-15:00
+_MORNING_OPEN = 9 * 60 + 30
+_MORNING_CLOSE = 11 * 60 + 30
+_AFTERNOON_OPEN = 13 * 60
+_MORNING_MINUTES = _MORNING_CLOSE - _MORNING_OPEN
+
+# K 线聚合规则（其他列取最后一根）
+_BAR_AGGREGATION = {
+    'open': 'first',
+    'high': 'max',
+    'low': 'min',
+    'close': 'last',
+    'volume': 'sum',
+    'amount': 'sum',
+}
+
+
+def sort_stock_data(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    规范化股票数据的时间索引：DatetimeIndex、升序、无重复
+    
+    只在加载时做一次，之后即可用 slice_until() 做 O(log n) 的二分切片
+    
+    参数:
+    - df: 股票数据 DataFrame
+    
+    返回:
+    按时间升序排列的 DataFrame（已有序时不复制）
+    """
+    if df.empty:
+        return df
+    
+    if not isinstance(df.index, pd.DatetimeIndex):
+        df = df.set_axis(pd.to_datetime(df.index), axis=0)
+    
+    if not df.index.is_monotonic_increasing:
+        df = df.sort_index()
+    
+    if df.index.has_duplicates:
+        df = df[~df.index.duplicated(keep='last')]
+    
+    return df
+
+
+def slice_until(
+    df: pd.DataFrame,
+    end,
+    lookback: Optional[int] = None,
+    side: str = 'right'
+) -> pd.DataFrame:
+    """
+    截取时间不晚于 end 的数据（二分查找，不扫描整个 DataFrame）
+    
+    参数:
+    - df: 按时间升序排列的 DataFrame（见 sort_stock_data）
+    - end: 截止时间
+    - lookback: 只返回最后 lookback 行（可选），None 表示返回全部历史
+    - side: 'right' 包含 end 本身，'left' 不包含
+    
+    返回:
+    DataFrame 切片（位置切片，不复制数据）
+    """
+    stop = df.index.searchsorted(end, side=side)
+    start = 0 if lookback is None else max(stop - lookback, 0)
+    return df.iloc[start:stop]
+
+
+def _range_cache_path(
+    symbol: str,
+    start_date: str,
+    end_date: str,
+    frequency: str,
+    adjust_flag: str,
+    cache_dir: str
+) -> Optional[str]:
+    """
+    获取区间缓存文件路径
+    
+    结束日期不早于今天的区间数据仍可能变化，不缓存（返回 None）
+    """
+    start = pd.Timestamp(start_date).strftime('%Y-%m-%d')
+    end = pd.Timestamp(end_date)
+    if end.normalize() >= pd.Timestamp.today().normalize():
+        return None
+    
+    # 早期版本没有把 adjust_flag 传给数据源，"_1"/"_3" 文件中实际是前复权数据；
+    # 非默认复权使用新的文件名，不读取这些旧文件
+    suffix = adjust_flag if adjust_flag == "2" else f"adjust{adjust_flag}"
+    file_name = f"{frequency}_{start}_{end.strftime('%Y-%m-%d')}_{suffix}.parquet"
+    return os.path.join(cache_dir, symbol, file_name)
+
+
+def get_cached_stock_data(
+    symbol: str,
+    start_date: str,
+    end_date: str,
+    frequency: str = "d",
+    adjust_flag: str = "2",
+    cache_dir: Optional[str] = None,
+    columns: Optional[List[str]] = None
+) -> pd.DataFrame:
+    """
+    获取股票数据（带区间级 Parquet 缓存）
+    
+    同一 (symbol, start_date, end_date, frequency, adjust_flag) 的数据合并为一个
+    已排序的 Parquet 文件，重复回测（如参数扫描）直接读取，无需再逐日读取或请求数据源
+    
+    参数:
+    - symbol: 股票代码（如 "000651"）
+    - start_date: 开始日期 "YYYY-MM-DD"
+    - end_date: 结束日期 "YYYY-MM-DD"
+    - frequency: 数据频率 "d"=日线, "5"=5分钟等
+    - adjust_flag: 复权标志 "1"=后复权, "2"=前复权, "3"=不复权
+    - cache_dir: 缓存目录（默认 RANGE_CACHE_DIR）
+    - columns: 只需要的列（可选，如 OHLCV），命中 Parquet 缓存时只读取这些列；不存在的列忽略
+    
+    返回:
+    按时间升序排列的 DataFrame
+    
+    注意:
+    - 结束日期不早于今天时不使用缓存（当天数据仍可能更新）
+    - 同一进程内最近使用的 MEMORY_CACHE_SIZE 个区间保存在内存中，返回其浅拷贝
+    """
+    path = _range_cache_path(
+        symbol, start_date, end_date, frequency, adjust_flag,
+        cache_dir or RANGE_CACHE_DIR
+    )
+    
+    if path is None:
+        return _select_columns(
+            sort_stock_data(get_stock_data(symbol, start_date, end_date, frequency, adjust_flag)), columns
+        )
+    
+    with _memory_cache_lock:
+        df = _memory_cache.get(path)
+        if df is not None:
+            _memory_cache.move_to_end(path)
+            return _select_columns(df, columns)
+    
+    if os.path.exists(path):
+        if columns is not None:
+            # 列式读取：只解码需要的列，不放入进程内缓存（内存缓存只保存完整数据）
+            available = set(pq.read_schema(path).names)
+            return pd.read_parquet(
+                path, engine="pyarrow", columns=[col for col in columns if col in available]
+            )
+        df = pd.read_parquet(path, engine="pyarrow")
+    else:
+        df = sort_stock_data(get_stock_data(symbol, start_date, end_date, frequency, adjust_flag))
+        if df.empty:
+            return df
+        
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 先写临时文件再替换，避免中断时留下不完整的缓存；
+        # 临时文件名唯一，多个进程同时写同一区间时互不覆盖（os.replace 是原子的，最后一个生效）
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        os.close(fd)
+        try:
+            df.to_parquet(tmp_path, compression="zstd")
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+    
+    with _memory_cache_lock:
+        _memory_cache[path] = df
+        while len(_memory_cache) > MEMORY_CACHE_SIZE:
+            _memory_cache.popitem(last=False)
+    
+    return _select_columns(df, columns)
+
+
+def _select_columns(df: pd.DataFrame, columns: Optional[List[str]]) -> pd.DataFrame:
+    """选择存在的列；未指定列时返回浅拷贝（写时复制，不影响缓存中的数据）"""
+    if columns is None:
+        return df.copy(deep=False)
+    return df[[col for col in columns if col in df.columns]]
+
+
+def resample_minute_data(df: pd.DataFrame, frequency: str) -> pd.DataFrame:
+    """
+    将 5 分钟线聚合为更粗的分钟线（"15"、"30"、"60"）
+    
+    按 A股交易时段切分 K 线，与 BaoStock 分钟线一致：时间戳为 K 线结束时间，
+    例如 60 分钟线为 10:30、11:30、14:00、15:00
+    
+    参数:
+    - df: 按时间升序排列的 5 分钟线 DataFrame（索引为 K 线结束时间）
+    - frequency: 目标频率（分钟数字符串）
+    
+    返回:
+    聚合后的 DataFrame，列与输入一致
+    """
+    if df.empty:
+        return df
+    
+    minutes = int(frequency)
+    index = df.index
+    clock = np.asarray(index.hour * 60 + index.minute)
+    
+    # 交易分钟：K 线结束时刻距开盘的交易分钟数，取值 (0, 240]
+    trade_minute = np.where(
+        clock <= _MORNING_CLOSE,
+        clock - _MORNING_OPEN,
+        clock - _AFTERNOON_OPEN + _MORNING_MINUTES
+    )
+    
+    # 所属 K 线的结束交易分钟，再换算回时钟时间
+    slot_end = -(-trade_minute // minutes) * minutes
+    end_clock = np.where(
+        slot_end <= _MORNING_MINUTES,
+        _MORNING_OPEN + slot_end,
+        _AFTERNOON_OPEN + slot_end - _MORNING_MINUTES
+    )
+    labels = index.normalize() + pd.to_timedelta(end_clock, unit='min')
+    
+    aggregation = {col: _BAR_AGGREGATION.get(col, 'last') for col in df.columns}
+    result = df.groupby(labels, sort=True).agg(aggregation)
+    result.index.name = index.name
+    
+    return result
+
+
+def _date2num_array(index: pd.DatetimeIndex) -> np.ndarray:
+    """
+    向量化的 bt.date2num：把 DatetimeIndex 一次性转为 Backtrader 的浮点时间戳
+    
+    bt.date2num 用 math.fsum 累加 日序数、时/24、分/1440、秒/86400、微秒/8.64e10，
+    这里对同样的各项做补偿求和（Neumaier），与逐个调用 bt.date2num 的结果一致；
+    带时区的索引先转换为 UTC
+    """
+    if index.tz is not None:
+        index = index.tz_convert('UTC').tz_localize(None)
+    
+    # 0001-01-01 的序数为 1，1970-01-01 的序数为 719163
+    ordinal = index.to_numpy().astype('datetime64[D]').astype(np.int64) + 719163
+    terms = (
+        index.hour.to_numpy(dtype=np.float64) / 24.0,
+        index.minute.to_numpy(dtype=np.float64) / 1440.0,
+        index.second.to_numpy(dtype=np.float64) / 86400.0,
+        index.microsecond.to_numpy(dtype=np.float64) / 8.64e10,
+    )
+    
+    total = ordinal.astype(np.float64)
+    compensation = np.zeros_like(total)
+    for term in terms:
+        new_total = total + term
+        compensation += np.where(
+            np.abs(total) >= np.abs(term),
+            (total - new_total) + term,
+            (term - new_total) + total
+        )
+        total = new_total
+    
+    return total + compensation
+
+
+def num2date_array(nums) -> pd.DatetimeIndex:
+    """
+    向量化的 bt.num2date：把 Backtrader 的浮点时间戳数组一次性转为 DatetimeIndex（不含时区）
+    
+    与 bt.num2date 的拆分方式一致（逐级取 时、分、秒、微秒，微秒截断，并做同样的舍入补偿）
+    """
+    nums = np.asarray(nums, dtype=np.float64)
+    days = np.floor(nums)
+    hour, remainder = np.divmod(24.0 * (nums - days), 1.0)
+    minute, remainder = np.divmod(60.0 * remainder, 1.0)
+    second, remainder = np.divmod(60.0 * remainder, 1.0)
+    microsecond = np.trunc(1e6 * remainder).astype(np.int64)
+    
+    # 与 bt.num2date 相同的浮点误差补偿：小于 10 微秒视为 0，大于 999990 微秒进位到下一秒
+    microsecond[microsecond < 10] = 0
+    carry = microsecond > 999990
+    microsecond[carry] = 1_000_000
+    
+    # 0001-01-01 的序数为 1，1970-01-01 的序数为 719163
+    micros = (
+        (days.astype(np.int64) - 719163) * 86_400_000_000
+        + (hour.astype(np.int64) * 3600 + minute.astype(np.int64) * 60 + second.astype(np.int64)) * 1_000_000
+        + microsecond
+    )
+    return pd.DatetimeIndex(micros.astype('datetime64[us]'))
+
+
+class ArrayPandasData(bt.feeds.PandasData):
+    """
+    基于预取数组的 PandasData
+    
+    参数与 bt.feeds.PandasData 相同。start() 时一次性把各列和时间戳转为 Python 列表，
+    _load() 每根 K 线只做列表下标读取，避免 PandasData 逐个字段调用 DataFrame.iloc。
+    """
+    
+    def start(self):
+        # 父类负责重置游标并把列名映射为列位置
+        super().start()
+        
+        df = self.p.dataname
+        self._columns = [
+            (getattr(self.lines, field), df.iloc[:, col].to_numpy(dtype=np.float64).tolist())
+            for field, col in self._colmapping.items()
+            if field != 'datetime' and col is not None
+        ]
+        
+        coldtime = self._colmapping['datetime']
+        tstamps = df.index if coldtime is None else df.iloc[:, coldtime]
+        self._dtnums = _date2num_array(pd.DatetimeIndex(tstamps)).tolist()
+        self._nrows = len(df)
+    
+    def _load(self):
+        self._idx += 1
+        
+        if self._idx >= self._nrows:
+            return False
+        
+        idx = self._idx
+        for line, values in self._columns:
+            line[0] = values[idx]
+        self.lines.datetime[0] = self._dtnums[idx]
+        
+        return True
 
 
 def prepare_backtrader_data(
@@ -21,57 +364,56 @@ def prepare_backtrader_data(
     返回:
     Backtrader PandasData 对象
     """
-    # 确保索引是 DatetimeIndex
+    # 确保索引是 DatetimeIndex（不修改调用方传入的 DataFrame）
     if not isinstance(df.index, pd.DatetimeIndex):
         if 'date' in df.columns:
             df = df.set_index('date')
-        else:
-            df.index = pd.to_datetime(df.index)
-    
-    # 确保列名符合 Backtrader 要求（小写）
-    column_mapping = {
-        'open': 'open',
-        'high': 'high',
-        'low': 'low',
-        'close': 'close',
-        'volume': 'volume',
-        'Open': 'open',
-        'High': 'high',
-        'Low': 'low',
-        'Close': 'close',
-        'Volume': 'volume',
-    }
-    
-    # 重命名列
-    for old_col, new_col in column_mapping.items():
-        if old_col in df.columns and new_col not in df.columns:
-            df[new_col] = df[old_col]
+        if not isinstance(df.index, pd.DatetimeIndex):
+            df = df.set_axis(pd.to_datetime(df.index), axis=0)
+    
+    # 确保列名符合 Backtrader 要求（统一转为小写）
+    df = df.rename(columns=lambda col: col.lower() if isinstance(col, str) else col)
     
     # 选择需要的列
-    required_cols = ['open', 'high', 'low', 'close', 'volume']
+    required_cols = OHLCV_COLUMNS
     available_cols = [col for col in required_cols if col in df.columns]
     
+    duplicated_cols = [col for col in available_cols if (df.columns == col).sum() > 1]
+    if duplicated_cols:
+        raise ValueError(f"数据中存在仅大小写不同的重复列: {duplicated_cols}")
+    
     if len(available_cols) < 4:  # 至少需要 OHLC
         raise ValueError(
             f"数据缺少必要的列，需要: {required_cols}, "
             f"实际有: {df.columns.tolist()}"
         )
     
-    # 确保数据按时间排序
-    df = df.sort_index()
+    # 一次完成列选择和数值类型统一：OHLCV 转为一个连续的 float64 数组
+    # （Backtrader 的 line 本身就是 float64，更窄的类型在加载时也会被转换回来）
+    values = df[available_cols].to_numpy(dtype=np.float64)
+    index = df.index
     
-    # 移除缺失值
-    df = df.dropna(subset=available_cols)
+    # 确保数据按时间排序（已有序时跳过）
+    if not index.is_monotonic_increasing:
+        order = index.argsort(kind='stable')
+        values, index = values[order], index[order]
+    
+    # 移除缺失值（基于同一数组判断）
+    valid = ~np.isnan(values).any(axis=1)
+    if not valid.all():
+        values, index = values[valid], index[valid]
+    
+    df = pd.DataFrame(values, index=index, columns=available_cols)
     
     # 创建 Backtrader 数据源
-    data = bt.feeds.PandasData(
+    data = ArrayPandasData(
         dataname=df,
         datetime=None,  # 使用索引作为日期
         open='open',
         high='high',
         low='low',
         close='close',
-        volume='volume',
+        volume='volume' if 'volume' in available_cols else -1,
         openinterest=-1,  # 股票不需要持仓量
     )
     
@@ -101,8 +443,11 @@ def load_stock_data_to_backtrader(
     返回:
     Backtrader PandasData 对象
     """
-    # 获取数据
-    df = get_stock_data(symbol, start_date, end_date, frequency)
+    # 获取数据（已排序、去重，优先读取区间缓存）
+    # 只读取 Backtrader 需要的 OHLCV 列
+    df = get_cached_stock_data(
+        symbol, start_date, end_date, frequency, adjust_flag, columns=OHLCV_COLUMNS
+    )
     
     if df.empty:
         raise ValueError(
@@ -2,14 +2,95 @@
 Backtrader 回测引擎
 提供统一的回测接口
 """
+from __future__ import annotations
+
+import copy
+import os
+import sys
+
 import backtrader as bt
-from typing import Optional, Dict, Any, Type, List, List
-from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional, Dict, Any, NamedTuple, Tuple, Type, List
 import pandas as pd
 
-from model.backtrader.core.data_adapter import load_stock_data_to_backtrader, prepare_backtrader_data
+from model.backtrader.core.data_adapter import (
+    DERIVED_MINUTE_FREQUENCIES,
+    get_cached_stock_data,
+    load_stock_data_to_backtrader,
+    prepare_backtrader_data,
+    resample_minute_data,
+)
 from model.backtrader.core.comm_info import ChinaStockCommInfo
-from utils.stock_data import get_stock_data
+from model.backtrader.core.shared_cache import SharedFrameCache, attach_frames, publish_frames
+
+
+# 频率名称映射（用于日志输出）
+_FREQUENCY_NAMES = {
+    "5": "5分钟",
+    "15": "15分钟",
+    "30": "30分钟",
+    "60": "60分钟",
+    "d": "日线",
+    "w": "周线",
+    "m": "月线"
+}
+
+
+# 按费率参数缓存的 ChinaStockCommInfo（只读，参数扫描时各引擎共用同一实例）
+_COMMINFO_CACHE: Dict[Tuple[float, float, float], ChinaStockCommInfo] = {}
+
+
+def _get_comminfo(commission: float, stamp_tax: float, min_commission: float) -> ChinaStockCommInfo:
+    """获取指定费率的 ChinaStockCommInfo，相同费率只创建一次"""
+    key = (commission, stamp_tax, min_commission)
+    comminfo = _COMMINFO_CACHE.get(key)
+    if comminfo is None:
+        comminfo = _COMMINFO_CACHE[key] = ChinaStockCommInfo(
+            commission=commission,
+            stamp_tax=stamp_tax,
+            min_commission=min_commission
+        )
+    return comminfo
+
+
+class _CachedFeed(NamedTuple):
+    """暂存的主数据源：只记录数据缓存中的频率，创建 Cerebro 时（_build）才转换为数据源"""
+    frequency: str
+    name: str
+
+
+def _init_worker():
+    """
+    工作进程初始化：每个进程只用一个计算线程，避免 进程数 × CPU 核心数 个线程相互争抢
+    
+    注意:
+    - 执行到这里时 numpy 及其 BLAS/OpenMP 运行库已经加载（fork 继承自父进程，spawn 在反序列化
+      本函数时导入），OMP_NUM_THREADS 等环境变量不再生效，因此用 threadpoolctl 在运行时限制线程池；
+      未安装 threadpoolctl 时 BLAS/OpenMP 线程数保持不变
+    - numba 延迟到内核第一次调用时才导入：尚未导入时设置 NUMBA_NUM_THREADS（已设置的优先），
+      已导入时（fork 继承）直接设置线程数
+    """
+    try:
+        from threadpoolctl import threadpool_limits
+    except ImportError:
+        pass
+    else:
+        # 限制在整个工作进程生命周期内有效（不作为上下文管理器使用）
+        threadpool_limits(limits=1)
+    
+    numba = sys.modules.get('numba')
+    if numba is not None:
+        numba.set_num_threads(1)
+    else:
+        os.environ.setdefault('NUMBA_NUM_THREADS', '1')
+
+
+def _run_engine(engine: BacktestEngine) -> Dict[str, Any]:
+    """在子进程中运行回测（模块级函数，供进程池调用）"""
+    result = engine.run()
+    # 策略实例持有 backtrader 运行时状态，不在进程间传递
+    result['strategy'] = None
+    return result
 
 
 class BacktestEngine:
@@ -19,6 +100,15 @@ class BacktestEngine:
     封装 Backtrader 的 Cerebro，提供简洁的接口
     """
     
+    # 参数扫描时会创建大量实例，使用 __slots__ 省去每个实例的 __dict__
+    __slots__ = (
+        'initial_cash', 'commission', 'stamp_tax', 'min_commission',
+        'printlog', 'trigger_frequency', 'exactbars', 'stdstats',
+        'cerebro', '_pending', '_data_sources_added', '_stock_data_cache',
+        '_all_frequencies', '_stock_symbol', '_stock_start_date', '_stock_end_date',
+        '_strategy_injection',
+    )
+    
     def __init__(
         self,
         initial_cash: float = 100000.0,
@@ -26,7 +116,9 @@ class BacktestEngine:
         stamp_tax: float = 0.001,
         min_commission: float = 5.0,
         printlog: bool = False,
-        trigger_frequency: Optional[str] = None
+        trigger_frequency: Optional[str] = None,
+        exactbars: int = 0,
+        stdstats: bool = False
     ):
         """
         初始化回测引擎
@@ -39,6 +131,11 @@ class BacktestEngine:
         - printlog: 是否打印日志
         - trigger_frequency: 触发频率（用于设置主数据源），如 "d"（日线）、"5"（5分钟）、"15"（15分钟）等
                            None 表示使用默认（5分钟）
+        - exactbars: 传给 cerebro.run() 的 exactbars（默认 0，保留全部 K 线）
+                     1 表示只保留指标所需的最少 K 线以节省内存，但会关闭预加载/向量化运行和绘图，
+                     且策略不能再回看完整历史（如 get_full_dataframe()、HCDStrategy），仅适用于只读取近期数据的策略
+        - stdstats: 是否添加 Backtrader 默认观察者（Broker、BuySell、Trades），默认不添加；
+                    需要在 plot() 中显示资金曲线和买卖点时设为 True
         """
         self.initial_cash = initial_cash
         self.commission = commission
@@ -46,23 +143,18 @@ class BacktestEngine:
         self.min_commission = min_commission
         self.printlog = printlog
         self.trigger_frequency = trigger_frequency or "5"  # 默认5分钟
-        
-        # 创建 Cerebro
-        self.cerebro = bt.Cerebro()
-        
-        # 设置初始资金
-        self.cerebro.broker.setcash(initial_cash)
-        
-        # 设置手续费和印花税
-        comminfo = ChinaStockCommInfo(
-            commission=commission,
-            stamp_tax=stamp_tax,
-            min_commission=min_commission
-        )
-        self.cerebro.broker.addcommissioninfo(comminfo)
-        
-        # 设置其他参数
-        self.cerebro.broker.set_coc(True)  # 允许收盘价成交
+        self.exactbars = exactbars
+        self.stdstats = stdstats
+        
+        # Cerebro 延迟到 run()/plot()/get_cerebro() 时才创建（见 _build）
+        # 在此之前添加的数据源、策略、分析器、观察者先暂存
+        self.cerebro: Optional[bt.Cerebro] = None
+        self._pending: Dict[str, List] = {
+            'datas': [],
+            'strategies': [],
+            'analyzers': [],
+            'observers': [],
+        }
         
         # 数据源配置
         self._data_sources_added = False
@@ -70,6 +162,9 @@ class BacktestEngine:
         # 存储所有频率的数据（供策略使用，不添加到 backtrader）
         # 格式: {frequency: DataFrame}
         self._stock_data_cache: Dict[str, pd.DataFrame] = {}
+        
+        # 自动传递给策略的参数（股票信息和数据缓存），由 add_stock_data() 更新
+        self._strategy_injection: Dict[str, Any] = {'_stock_data_cache': self._stock_data_cache}
     
     def add_data(
         self,
@@ -103,7 +198,7 @@ class BacktestEngine:
         """
         if df is not None:
             # 使用提供的 DataFrame
-            data = prepare_backtrader_data(df, name=name or symbol or f"data_{len(self.cerebro.datas)}")
+            data = prepare_backtrader_data(df, name=name or symbol or f"data_{self._data_count()}")
         elif symbol and start_date and end_date:
             # 从数据源加载
             data = load_stock_data_to_backtrader(
@@ -116,9 +211,9 @@ class BacktestEngine:
         else:
             raise ValueError("必须提供 DataFrame 或 (symbol, start_date, end_date)")
         
-        # 添加数据源到 Cerebro
+        # 添加数据源（创建 Cerebro 时加入）
         # Backtrader 会自动处理主数据源和辅助数据源的同步
-        self.cerebro.adddata(data)
+        self._pending['datas'].append(data)
         
         return self
     
@@ -142,6 +237,7 @@ class BacktestEngine:
         注意:
         - 主数据源（触发频率）由 BacktestEngine 的 trigger_frequency 参数决定
         - 所有数据源都会被添加，但只有主数据源会触发 next()
+        - 策略只使用触发频率时，传入 frequencies=[trigger_frequency] 只加载这一个频率
         
         返回:
         self（支持链式调用）
@@ -149,69 +245,175 @@ class BacktestEngine:
         示例:
         # 自动添加所有数据源（5分钟、15分钟、30分钟、60分钟、日线）
         engine.add_stock_data("000651", "2025-01-01", "2025-12-31")
+        
+        # 只加载日线（trigger_frequency="d" 且策略不使用其他频率）
+        engine.add_stock_data("000651", "2025-01-01", "2025-12-31", frequencies=["d"])
         """
         # 保存所有频率信息、股票代码和日期范围，供策略使用
         if frequencies is None:
-            self._all_frequencies = ["5", "15", "30", "60", "d"]  # 默认：所有分钟线（5、15、30、60分钟）和日线
-        else:
-            self._all_frequencies = frequencies.copy()
-        
-        self._stock_symbol = symbol
-        self._stock_start_date = start_date
-        self._stock_end_date = end_date
-        
-        # 根据 trigger_frequency 设置主数据源
-        main_frequency = self.trigger_frequency
-        
-        # 频率名称映射
-        frequency_names = {
-            "5": "5分钟",
-            "15": "15分钟",
-            "30": "30分钟",
-            "60": "60分钟",
-            "d": "日线",
-            "w": "周线",
-            "m": "月线"
-        }
+            frequencies = ["5", "15", "30", "60", "d"]  # 默认：所有分钟线（5、15、30、60分钟）和日线
+        self._set_stock_info(symbol, start_date, end_date, frequencies)
         
         # 1. 加载并存储所有频率的数据（供策略使用，不添加到 backtrader）
         if self.printlog:
             print(f"正在加载所有频率的数据（供策略使用）...")
         
+        # 15/30/60 分钟线由 5 分钟线聚合得到（同时请求了 5 分钟线时），只加载一次 5 分钟数据
+        derive_from_5 = "5" in self._all_frequencies
+        derived = {
+            freq for freq in self._all_frequencies
+            if derive_from_5 and freq in DERIVED_MINUTE_FREQUENCIES
+        }
+        fetch_frequencies = [freq for freq in self._all_frequencies if freq not in derived]
+        
+        if len(fetch_frequencies) == 1:
+            # 只需要加载一个频率时直接调用，不创建线程池
+            fetched = {fetch_frequencies[0]: get_cached_stock_data(symbol, start_date, end_date, fetch_frequencies[0])}
+        else:
+            # 各频率的加载是 I/O 密集型操作，并发获取
+            with ThreadPoolExecutor(max_workers=max(1, len(fetch_frequencies))) as executor:
+                futures = {
+                    freq: executor.submit(get_cached_stock_data, symbol, start_date, end_date, freq)
+                    for freq in fetch_frequencies
+                }
+                fetched = {freq: future.result() for freq, future in futures.items()}
+        
+        # 结果按频率顺序写入缓存（已按时间排序，策略侧用二分查找切片）
         for freq in self._all_frequencies:
             if self.printlog:
-                freq_name = frequency_names.get(freq, freq)
-                print(f"  加载 {symbol} 的 {freq_name} 数据...")
+                freq_name = _FREQUENCY_NAMES.get(freq, freq)
+                source = "（由5分钟线聚合）" if freq in derived else ""
+                print(f"  加载 {symbol} 的 {freq_name} 数据{source}...")
             
-            # 加载数据并存储到缓存中
-            df = get_stock_data(symbol, start_date, end_date, freq)
-            self._stock_data_cache[freq] = df
+            if freq in derived:
+                self._stock_data_cache[freq] = resample_minute_data(fetched["5"], freq)
+            else:
+                self._stock_data_cache[freq] = fetched[freq]
         
         if self.printlog:
             print(f"✓ 已加载 {len(self._all_frequencies)} 个频率的数据到缓存")
         
         # 2. 只添加 trigger_frequency 指定的数据源到 backtrader（限制 next() 触发频率）
-        # 这样只有这个频率会触发 next()，避免额外触发
+        self._add_main_data(symbol, start_date, end_date)
+        
+        return self
+    
+    def _add_main_data(self, symbol: str, start_date: str, end_date: str):
+        """添加主数据源（trigger_frequency 指定的频率），只有这个频率会触发 next()，避免额外触发"""
+        main_frequency = self.trigger_frequency
+        
         if self.printlog:
-            freq_name = frequency_names.get(main_frequency, main_frequency)
+            freq_name = _FREQUENCY_NAMES.get(main_frequency, main_frequency)
             print(f"正在添加 {symbol} 的 {freq_name} 数据到 backtrader（主数据源，触发频率）...")
         
-        self.add_data(
-            symbol=symbol,
-            start_date=start_date,
-            end_date=end_date,
-            frequency=main_frequency,
-            name=f"{symbol}_{main_frequency}",
-            is_main=True
-        )
+        if main_frequency in self._stock_data_cache:
+            # 直接使用缓存中的数据，避免重复加载，并保证与策略看到的数据一致；
+            # 只暂存频率，到 _build() 时才转换，run_many() 序列化引擎时不会再复制一份主数据
+            # （数据缓存为共享内存时，工作进程直接从共享内存构建）
+            self._pending['datas'].append(_CachedFeed(main_frequency, f"{symbol}_{main_frequency}"))
+        else:
+            self.add_data(
+                symbol=symbol,
+                start_date=start_date,
+                end_date=end_date,
+                frequency=main_frequency,
+                name=f"{symbol}_{main_frequency}",
+                is_main=True
+            )
         
         self._data_sources_added = True
         
         if self.printlog:
             print(f"✓ 已添加主数据源（{main_frequency}），策略可通过 get_synced_data_by_frequency() 获取其他频率的同步数据")
+    
+    def publish_shared_cache(self) -> Dict[str, Any]:
+        """
+        把 add_stock_data() 加载的各频率数据发布到共享内存（用于多进程参数扫描）
+        
+        返回:
+        共享内存描述（spec），可传给其他引擎的 attach_shared_cache()
+        
+        注意:
+        - 发布后本引擎的数据缓存改为共享内存中的只读 DataFrame
+        - 使用 run_many() 时，工作进程映射同一份内存，不再各自复制数据
+        - 全部回测结束后调用 release_shared_cache() 删除共享内存；未调用时在本引擎的缓存被回收
+          或进程退出时自动删除，因此回测结束前需保持本引擎存活
+        
+        示例:
+        base = BacktestEngine(trigger_frequency="5")
+        base.add_stock_data("000651", "2024-01-01", "2024-12-31")
+        spec = base.publish_shared_cache()
+        engines = []
+        for period in [10, 20, 30]:
+            engine = BacktestEngine(trigger_frequency="5")
+            engine.attach_shared_cache(spec)
+            engine.add_strategy(MyStrategy, period=period)
+            engines.append(engine)
+        results = BacktestEngine.run_many(engines)
+        base.release_shared_cache()
+        """
+        if not self._data_sources_added or not hasattr(self, '_stock_symbol'):
+            raise ValueError("请先调用 add_stock_data() 加载数据")
+        
+        if not isinstance(self._stock_data_cache, SharedFrameCache):
+            self._set_stock_data_cache(publish_frames(
+                self._stock_data_cache,
+                symbol=self._stock_symbol,
+                start_date=self._stock_start_date,
+                end_date=self._stock_end_date,
+                frequencies=self._all_frequencies,
+            ))
+        
+        return self._stock_data_cache.spec
+    
+    def attach_shared_cache(self, spec: Dict[str, Any]):
+        """
+        使用共享内存中的数据代替 add_stock_data()（不再加载数据）
+        
+        参数:
+        - spec: publish_shared_cache() 返回的共享内存描述
+        
+        返回:
+        self（支持链式调用）
+        """
+        metadata = spec['metadata']
+        self._set_stock_info(
+            metadata['symbol'], metadata['start_date'], metadata['end_date'], metadata['frequencies']
+        )
+        self._set_stock_data_cache(attach_frames(spec))
+        
+        self._add_main_data(self._stock_symbol, self._stock_start_date, self._stock_end_date)
         
         return self
     
+    def release_shared_cache(self):
+        """删除 publish_shared_cache() 创建的共享内存"""
+        if isinstance(self._stock_data_cache, SharedFrameCache):
+            self._stock_data_cache.release()
+    
+    def _set_stock_info(self, symbol: str, start_date: str, end_date: str, frequencies: List[str]):
+        """保存股票代码、日期范围和所有频率，并预先生成传递给策略的参数"""
+        self._all_frequencies = list(frequencies)
+        self._stock_symbol = symbol
+        self._stock_start_date = start_date
+        self._stock_end_date = end_date
+        
+        self._strategy_injection.update({
+            '_stock_symbol': symbol,
+            '_stock_start_date': start_date,
+            '_stock_end_date': end_date,
+            '_all_frequencies': self._all_frequencies,
+        })
+    
+    def _set_stock_data_cache(self, cache: Dict[str, pd.DataFrame]):
+        """替换数据缓存，同时更新已暂存策略参数中对旧缓存的引用"""
+        old_cache = self._stock_data_cache
+        for _, strategy_params in self._pending['strategies']:
+            if strategy_params.get('_stock_data_cache') is old_cache:
+                strategy_params['_stock_data_cache'] = cache
+        self._stock_data_cache = cache
+        self._strategy_injection['_stock_data_cache'] = cache
+    
     def add_strategy(
         self,
         strategy_class: Type[bt.Strategy],
@@ -227,19 +429,10 @@ class BacktestEngine:
         注意:
         - 会自动将股票代码、日期范围、所有频率等信息传递给策略，供获取同步数据使用
         """
-        # 将股票信息和数据缓存传递给策略参数，供策略使用
-        if hasattr(self, '_stock_symbol'):
-            strategy_params['_stock_symbol'] = self._stock_symbol
-        if hasattr(self, '_stock_start_date'):
-            strategy_params['_stock_start_date'] = self._stock_start_date
-        if hasattr(self, '_stock_end_date'):
-            strategy_params['_stock_end_date'] = self._stock_end_date
-        if hasattr(self, '_all_frequencies'):
-            strategy_params['_all_frequencies'] = self._all_frequencies
-        if hasattr(self, '_stock_data_cache'):
-            strategy_params['_stock_data_cache'] = self._stock_data_cache
-        
-        self.cerebro.addstrategy(strategy_class, **strategy_params)
+        # 将股票信息和数据缓存传递给策略参数，供策略使用（显式传入的参数优先）
+        strategy_params = {**self._strategy_injection, **strategy_params}
+        
+        self._pending['strategies'].append((strategy_class, strategy_params))
         return self
     
     def add_analyzer(self, analyzer_class: Type[bt.Analyzer], **analyzer_params):
@@ -250,7 +443,7 @@ class BacktestEngine:
         - analyzer_class: 分析器类
         - **analyzer_params: 分析器参数
         """
-        self.cerebro.addanalyzer(analyzer_class, **analyzer_params)
+        self._pending['analyzers'].append((analyzer_class, analyzer_params))
         return self
     
     def add_observer(self, observer_class: Type[bt.Observer], **observer_params):
@@ -261,9 +454,53 @@ class BacktestEngine:
         - observer_class: 观察者类
         - **observer_params: 观察者参数
         """
-        self.cerebro.addobserver(observer_class, **observer_params)
+        self._pending['observers'].append((observer_class, observer_params))
         return self
     
+    def _data_count(self) -> int:
+        """已添加的数据源数量（包括尚未加入 Cerebro 的）"""
+        added = len(self.cerebro.datas) if self.cerebro is not None else 0
+        return added + len(self._pending['datas'])
+    
+    def _build(self) -> bt.Cerebro:
+        """
+        创建并配置 Cerebro（只创建一次），并加入所有暂存的数据源、策略、分析器和观察者
+        
+        返回:
+        配置好的 Cerebro 对象
+        """
+        if self.cerebro is None:
+            # 默认观察者会为每根 K 线分配数组，回测结果不依赖它们，默认关闭
+            cerebro = bt.Cerebro(stdstats=self.stdstats, optreturn=True, quicknotify=True)
+            
+            # 设置初始资金
+            cerebro.broker.setcash(self.initial_cash)
+            
+            # 设置手续费和印花税
+            comminfo = _get_comminfo(self.commission, self.stamp_tax, self.min_commission)
+            cerebro.broker.addcommissioninfo(comminfo)
+            
+            # 设置其他参数
+            cerebro.broker.set_coc(True)  # 允许收盘价成交
+            
+            self.cerebro = cerebro
+        
+        for data in self._pending['datas']:
+            if isinstance(data, _CachedFeed):
+                data = prepare_backtrader_data(self._stock_data_cache[data.frequency], name=data.name)
+            self.cerebro.adddata(data)
+        for strategy_class, strategy_params in self._pending['strategies']:
+            self.cerebro.addstrategy(strategy_class, **strategy_params)
+        for analyzer_class, analyzer_params in self._pending['analyzers']:
+            self.cerebro.addanalyzer(analyzer_class, **analyzer_params)
+        for observer_class, observer_params in self._pending['observers']:
+            self.cerebro.addobserver(observer_class, **observer_params)
+        
+        for pending in self._pending.values():
+            pending.clear()
+        
+        return self.cerebro
+    
     def run(self) -> Dict[str, Any]:
         """
         运行回测
@@ -281,13 +518,15 @@ class BacktestEngine:
             print("=" * 60)
         
         # 运行回测
-        strategies = self.cerebro.run()
+        cerebro = self._build()
+        # 数据源已预先转为数组（ArrayPandasData），预加载后按向量化模式运行
+        strategies = cerebro.run(preload=True, runonce=True, exactbars=self.exactbars)
         
         # 获取结果
         strategy = strategies[0]
         
         # 获取最终资金
-        final_value = self.cerebro.broker.getvalue()
+        final_value = cerebro.broker.getvalue()
         
         # 计算收益率
         total_return = (final_value - self.initial_cash) / self.initial_cash * 100
@@ -299,10 +538,9 @@ class BacktestEngine:
             'strategy': strategy
         }
         
-        # 如果有分析器，添加分析结果
-        if hasattr(strategy, 'analyzers'):
-            for analyzer in strategy.analyzers:
-                result[analyzer.__class__.__name__] = analyzer.get_analysis()
+        # 添加分析结果（以分析器名称为键，默认为类名小写，可通过 _name 参数指定）
+        analyzers = strategy.analyzers
+        result.update({name: analyzers.getbyname(name).get_analysis() for name in analyzers.getnames()})
         
         if self.printlog:
             print("\n" + "=" * 60)
@@ -315,6 +553,98 @@ class BacktestEngine:
         
         return result
     
+    @staticmethod
+    def run_many(
+        engines: List[BacktestEngine],
+        n_workers: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        多进程并行运行多个回测引擎（如参数扫描）
+        
+        参数:
+        - engines: 已添加数据和策略、尚未运行的 BacktestEngine 列表
+        - n_workers: 进程数，默认使用 CPU 核心数
+        
+        返回:
+        与 engines 顺序一致的回测结果列表（同 run()，但 'strategy' 为 None）
+        
+        注意:
+        - 每个引擎连同暂存的数据源一起序列化到子进程，在子进程中创建 Cerebro 并运行
+        - 策略类必须定义在模块顶层（可被 pickle）
+        - 工作进程内的 numba 线程数限制为 1；安装了 threadpoolctl 时 OpenMP/MKL/OpenBLAS 线程池也限制为 1
+        - 多个引擎使用同一份数据时，可先 publish_shared_cache() 再 attach_shared_cache()，工作进程共享同一份内存
+        
+        示例:
+        engines = []
+        for period in [10, 20, 30]:
+            engine = BacktestEngine()
+            engine.add_stock_data("000651", "2024-01-01", "2024-12-31", frequencies=["d"])
+            engine.add_strategy(MyStrategy, period=period)
+            engines.append(engine)
+        results = BacktestEngine.run_many(engines)
+        """
+        for engine in engines:
+            if engine.cerebro is not None:
+                raise ValueError("run_many() 只能运行尚未创建 Cerebro 的引擎（不要先调用 run()/get_cerebro()）")
+        
+        with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker) as executor:
+            return list(executor.map(_run_engine, engines))
+    
+    def run_batch(
+        self,
+        strategy_class: Type[bt.Strategy],
+        param_grid: List[Dict[str, Any]],
+        parallel: bool = False,
+        n_workers: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        数据只加载一次，用每组参数运行同一策略（参数扫描）
+        
+        参数:
+        - strategy_class: 策略类
+        - param_grid: 策略参数列表，每个元素是一组参数
+        - parallel: 是否多进程并行运行（通过 run_many()），默认 False 依次在当前进程运行
+        - n_workers: 并行时的进程数，默认使用 CPU 核心数
+        
+        返回:
+        与 param_grid 顺序一致的回测结果列表（同 run()；并行时 'strategy' 为 None）
+        
+        注意:
+        - 每组参数使用新的 Cerebro，共享本引擎已加载的数据、数据源、分析器和观察者
+        - 本引擎已添加的策略不参与批量运行
+        - 并行时只有引擎配置、策略类和参数随任务发送到子进程，数据随数据源序列化；
+          策略类必须定义在模块顶层（可被 pickle）
+        
+        示例:
+        engine = BacktestEngine(trigger_frequency="d")
+        engine.add_stock_data("000651", "2024-01-01", "2024-12-31", frequencies=["d"])
+        results = engine.run_batch(MyStrategy, [{'period': 10}, {'period': 20}])
+        
+        # 多进程并行
+        results = engine.run_batch(MyStrategy, param_grid, parallel=True)
+        """
+        if self.cerebro is not None:
+            raise ValueError("run_batch() 只能在尚未创建 Cerebro 的引擎上调用（不要先调用 run()/get_cerebro()）")
+        
+        engines = []
+        for strategy_params in param_grid:
+            engine = self._clone()
+            engine.add_strategy(strategy_class, **strategy_params)
+            engines.append(engine)
+        
+        if parallel:
+            return BacktestEngine.run_many(engines, n_workers=n_workers)
+        return [engine.run() for engine in engines]
+    
+    def _clone(self) -> BacktestEngine:
+        """复制引擎配置和暂存的数据源、分析器、观察者（不含策略），数据对象共享"""
+        engine = copy.copy(self)
+        engine.cerebro = None
+        engine._pending = {key: list(items) for key, items in self._pending.items()}
+        engine._pending['strategies'] = []
+        engine._strategy_injection = dict(self._strategy_injection)
+        return engine
+    
     def plot(self, **kwargs):
         """
         绘制回测结果图表
@@ -322,10 +652,12 @@ class BacktestEngine:
         参数:
         - **kwargs: 传递给 cerebro.plot() 的参数
         """
-        self.cerebro.plot(**kwargs)
+        self._build().plot(**kwargs)
     
     def get_cerebro(self) -> bt.Cerebro:
         """
         获取底层的 Cerebro 对象（用于高级用法）
+        
+        注意：调用时会创建 Cerebro 并加入此前添加的所有组件
         """
-        return self.cerebro
+        return self._build()
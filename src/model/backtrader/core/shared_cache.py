@@ -0,0 +1,158 @@
+"""
+共享内存数据缓存
+参数扫描时把各频率的数据放入共享内存（/dev/shm 下的内存映射文件），
+多个工作进程映射同一份内存，避免每个进程各复制一份 OHLCV 数据
+"""
+import os
+import shutil
+import tempfile
+import weakref
+from typing import Any, Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+
+# 共享内存目录：Linux 下 /dev/shm 是内存文件系统，其他系统退回到临时目录（由页缓存共享）
+SHARED_CACHE_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+
+def _remove_directory(directory: str, pid: int):
+    """删除共享内存目录（只在创建它的进程中执行，fork 出的子进程回收继承的对象时不删除）"""
+    if os.getpid() == pid:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def _is_shareable(dtype) -> bool:
+    """定长数值类型（bool/int/uint/float）可以直接放入共享内存"""
+    return isinstance(dtype, np.dtype) and dtype.kind in 'biuf'
+
+
+class SharedFrameCache(dict):
+    """
+    {frequency: DataFrame} 缓存，数值列位于共享内存中（只读）
+
+    pickle 时只传递描述信息（spec），在子进程中重新映射同一份内存（零拷贝），
+    因此随 BacktestEngine 发送到 run_many() 的工作进程时不会复制数据
+
+    注意:
+    - 缓存中的 DataFrame 是只读的，需要修改时请先 copy()
+    - 只有创建者（publish_frames 返回的对象）可以调用 release() 删除共享内存；
+      未调用时，创建者被回收或进程退出时自动删除，因此其他进程映射完成前需保持创建者存活
+    """
+
+    def __init__(self, frames: Dict[str, pd.DataFrame], spec: Dict[str, Any], owner: bool = False):
+        super().__init__(frames)
+        self.spec = spec
+        self.owner = owner
+        self._finalizer = None
+
+    def __reduce__(self):
+        return attach_frames, (self.spec,)
+
+    def release(self):
+        """删除共享内存（已映射的进程仍可继续读取，直到映射被释放）"""
+        if self.owner:
+            # finalize 只执行一次，之后回收或退出时不再重复删除
+            self._finalizer()
+            self.owner = False
+
+
+def publish_frames(
+    frames: Dict[str, pd.DataFrame],
+    directory: Optional[str] = None,
+    **metadata
+) -> SharedFrameCache:
+    """
+    把多个 DataFrame 发布到共享内存
+
+    参数:
+    - frames: {frequency: DataFrame}，索引需为 DatetimeIndex
+    - directory: 共享内存所在目录（默认 SHARED_CACHE_DIR）
+    - **metadata: 附加信息（如股票代码、日期范围），原样保存在 spec['metadata'] 中
+
+    返回:
+    SharedFrameCache（创建者），其 spec 可传给 attach_frames() 在其他进程中映射
+
+    注意:
+    - 同一数值类型的列合并为一个 (列数, 行数) 的数组，每列在内存中连续
+    - 字符串等非定长类型的列不放入共享内存，随 spec 一起传递
+    """
+    root = tempfile.mkdtemp(prefix='stock_models_', dir=directory or SHARED_CACHE_DIR)
+    spec = {'directory': root, 'metadata': metadata, 'frames': {}}
+
+    for i, (key, df) in enumerate(frames.items()):
+        index = pd.DatetimeIndex(df.index)
+        np.save(os.path.join(root, f'{i}_index.npy'), index.asi8)
+
+        groups: Dict[str, list] = {}
+        objects = {}
+        for col, dtype in df.dtypes.items():
+            if _is_shareable(dtype):
+                groups.setdefault(dtype.str, []).append(col)
+            else:
+                objects[col] = df[col].to_numpy()
+
+        blocks = []
+        for j, (dtype_str, cols) in enumerate(groups.items()):
+            file_name = f'{i}_block{j}.npy'
+            block = np.lib.format.open_memmap(
+                os.path.join(root, file_name), mode='w+',
+                dtype=np.dtype(dtype_str), shape=(len(cols), len(df))
+            )
+            for row, col in enumerate(cols):
+                block[row] = df[col].to_numpy()
+            block.flush()
+            del block
+            blocks.append((file_name, cols))
+
+        spec['frames'][key] = {
+            'columns': list(df.columns),
+            'index_unit': index.unit,
+            'index_tz': None if index.tz is None else str(index.tz),
+            'index_name': index.name,
+            'index_file': f'{i}_index.npy',
+            'blocks': blocks,
+            'objects': objects,
+        }
+
+    cache = attach_frames(spec)
+    cache.owner = True
+    # 异常或忘记调用 release() 时兜底：创建者被回收或解释器退出时删除共享内存
+    cache._finalizer = weakref.finalize(cache, _remove_directory, root, os.getpid())
+    return cache
+
+
+def attach_frames(spec: Dict[str, Any]) -> SharedFrameCache:
+    """
+    根据 spec 映射共享内存中的 DataFrame（只读、零拷贝）
+
+    参数:
+    - spec: publish_frames() 返回对象的 spec
+
+    返回:
+    SharedFrameCache（非创建者）
+    """
+    root = spec['directory']
+    frames = {}
+
+    for key, item in spec['frames'].items():
+        index = pd.DatetimeIndex(
+            np.load(os.path.join(root, item['index_file'])).view(f"datetime64[{item['index_unit']}]"),
+            name=item['index_name']
+        )
+        if item['index_tz'] is not None:
+            index = index.tz_localize('UTC').tz_convert(item['index_tz'])
+
+        columns = dict(item['objects'])
+        for file_name, cols in item['blocks']:
+            block = np.load(os.path.join(root, file_name), mmap_mode='r')
+            for row, col in enumerate(cols):
+                columns[col] = block[row]
+
+        # 按原列顺序构造，copy=False 保持对共享内存的视图
+        frames[key] = pd.DataFrame(
+            {col: columns[col] for col in item['columns']}, index=index, copy=False
+        )
+
+    return SharedFrameCache(frames, spec)
@@ -2,11 +2,12 @@
 Backtrader 框架使用示例
 """
 from model.backtrader.core.engine import BacktestEngine
-from model.backtrader.strategy.hydro_cost_dynamics import HCDStrategy
 
 
 def example_hcd():
     """HCD (Hydro-Cost Dynamics) 策略示例"""
+    from model.backtrader.strategy.hydro_cost_dynamics import HCDStrategy
+    
     print("=" * 60)
     print("HCD 资金能流策略回测示例")
     print("=" * 60)
@@ -3,11 +3,12 @@
 演示如何使用日线、分时、周线等多种数据源
 """
 from model.backtrader.core.engine import BacktestEngine
-from model.backtrader.strategy.multi_data_strategy import SimpleMultiDataStrategy
 
 
 def example_multi_data():
     """多数据源策略示例"""
+    from model.backtrader.strategy.multi_data_strategy import SimpleMultiDataStrategy
+    
     print("=" * 60)
     print("多数据源策略回测示例")
     print("=" * 60)
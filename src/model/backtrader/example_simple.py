@@ -3,11 +3,12 @@
 演示如何使用自动添加数据源功能
 """
 from model.backtrader.core.engine import BacktestEngine
-from model.backtrader.strategy.rsi_strategy import RSIStrategy
 
 
 def example_simple():
     """简化版回测示例 - 只需指定股票和日期"""
+    from model.backtrader.strategy.rsi_strategy import RSIStrategy
+    
     print("=" * 60)
     print("简化版回测示例")
     print("=" * 60)
@@ -59,6 +60,8 @@ def example_simple():
 
 def example_custom_frequencies():
     """自定义数据频率示例"""
+    from model.backtrader.strategy.rsi_strategy import RSIStrategy
+    
     print("=" * 60)
     print("自定义数据频率示例")
     print("=" * 60)
@@ -4,13 +4,77 @@
 """
 from __future__ import annotations
 
+import functools
 import backtrader as bt
-from typing import List, Dict, Optional
-from datetime import datetime
+from typing import List, Dict, Optional, Set
+from datetime import date, datetime
+import numpy as np
 import pandas as pd
+from model.backtrader.core.data_adapter import num2date_array, slice_until
 from utils.stock_data import get_stock_data
 
 
+# 转为 DataFrame 的数据源 line
+_OHLCV_LINES = ('open', 'high', 'low', 'close', 'volume')
+
+
+@functools.lru_cache(maxsize=4096)
+def _str_to_date(value: str) -> date:
+    """把日期字符串解析为 date（结果缓存）：'YYYY-MM-DD' 直接解析，其他格式交给 pandas"""
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        return pd.Timestamp(value).date()
+
+
+def _available_bars(data: bt.LineSeries) -> int:
+    """数据源截至当前 K 线（含）可读取的 K 线数量（exactbars 模式下受缓冲区长度限制）"""
+    return min(len(data), data.datetime.idx + 1)
+
+
+def _build_lines_dataframe(data: bt.LineSeries, size: int, ago: int = 0) -> pd.DataFrame:
+    """把数据源 [ago - size + 1, ago] 范围内的 K 线一次性转为 DataFrame（复制底层数组）"""
+    datetimes = num2date_array(np.asarray(data.datetime.get(ago=ago, size=size), dtype=np.float64))
+    columns = {'datetime': datetimes}
+    for line_name in _OHLCV_LINES:
+        columns[line_name] = np.asarray(getattr(data, line_name).get(ago=ago, size=size), dtype=np.float64)
+    return pd.DataFrame(columns, index=pd.Index(datetimes.date, name='date'))
+
+
+def _lines_to_dataframe(data: bt.LineSeries) -> pd.DataFrame:
+    """
+    把数据源截至当前 K 线（含）的全部数据转为 DataFrame
+    
+    直接读取各 line 底层的 array.array（LineBuffer.get），不逐根 K 线访问。
+    预加载的数据源（缓冲区不限长度）只在缓冲区长度变化时整体转换一次，缓存在数据源对象上，
+    之后每根 K 线只从缓存中切出前 len(data) 行，同一数据源上的各策略、各次调用共用
+    
+    返回:
+    索引为日期（date），列为 datetime, open, high, low, close, volume
+    （切片或浅拷贝，修改返回值不影响缓存）
+    """
+    size = len(data)
+    if size == 0:
+        return pd.DataFrame()
+    
+    if data.datetime.mode != bt.linebuffer.LineBuffer.UnBounded:
+        # exactbars 模式下缓冲区是定长队列，只能读取当前保留的部分
+        return _build_lines_dataframe(data, _available_bars(data))
+    
+    # 整个缓冲区（含尚未到达的预加载 K 线）对应的 DataFrame，当前 K 线位于 idx
+    buflen = data.datetime.buflen()
+    cached = getattr(data, '_dataframe_cache', None)
+    if cached is None or cached[0] != buflen:
+        ahead = buflen - 1 - data.datetime.idx
+        full = _build_lines_dataframe(data, buflen, ago=ahead)
+        cached = data._dataframe_cache = (buflen, full)
+    
+    full = cached[1]
+    if size == len(full):
+        return full.copy(deep=False)
+    return full.iloc[:size]
+
+
 class BaseStrategy(bt.Strategy):
     """
     策略基类
@@ -52,12 +116,11 @@ class BaseStrategy(bt.Strategy):
         # 用于触发判断：记录上一次处理的日期/时间
         self._last_trigger_date = None
         
-        # 记录买入日期（用于 T+1 检查）
-        self._buy_dates: List[datetime] = []
+        # 记录买入日期（用于 T+1 检查，集合查找为 O(1)；只保留最近一个买入日）
+        self._buy_dates: Set[date] = set()
         
-        # 数据引用
-        self.datas = self.datas if hasattr(self, 'datas') else [self.data]
-        self.data = self.datas[0]  # 主数据源（backtrader 的 next() 总是由主数据源触发）
+        # 数据引用：self.datas / self.data 由 backtrader 设置，
+        # self.data 即主数据源（backtrader 的 next() 总是由主数据源触发）
         # 触发数据源（用于策略逻辑判断，可以不同于主数据源）
         self._trigger_data: Optional[bt.LineSeries] = None
         self._trigger_data_name: Optional[str] = None
@@ -68,14 +131,31 @@ class BaseStrategy(bt.Strategy):
         self._data_map_initialized = False
         
         # 指标存储：字典结构 {指标名: {日期: 值}} 或 {指标名: 值}
+        # 通过 set_indicator 写入的 {日期: 值} 字典始终按日期升序排列
         # 支持两种存储方式：
         # 1. 历史指标：{指标名: {日期: 值}} - 按日期存储历史值
         # 2. 当前指标：{指标名: 值} - 只存储当前值
         self.indicators: Dict[str, any] = {}
+        # 每个指标最近日期的 (日期, 值)，get_indicator 不指定日期时直接读取，无需 max() 扫描
+        self._latest_indicators: Dict[str, tuple] = {}
+        # get_indicator_history_series 的结果缓存，set_indicator 写入时失效
+        self._history_series_cache: Dict[str, pd.Series] = {}
+        
+        # 逐 K 线的数值指标：{指标名: float64 数组}，下标为 K 线序号（见 set_indicator_series）
+        self.indicator_series: Dict[str, np.ndarray] = {}
         
-        # 完整数据缓存（DataFrame）
-        self._full_dataframe: Optional[pd.DataFrame] = None
-        self._dataframe_initialized: bool = False
+        # 手续费参数 (commission, stamp_tax, min_commission)，在 start() 中从 broker 获取
+        self._fee_rates: Optional[tuple] = None
+        
+        # 当前 K 线日期缓存（见 get_current_date），每根 K 线只转换一次
+        self._current_date_len: int = -1
+        self._current_date: Optional[date] = None
+    
+    def start(self):
+        """回测开始前缓存手续费参数，用于在卖出日志中拆分手续费和印花税"""
+        params = self.broker.getcommissioninfo(self.data).p
+        rates = tuple(getattr(params, name, None) for name in ('commission', 'stamp_tax', 'min_commission'))
+        self._fee_rates = None if None in rates else rates
     
     def log(self, txt: str, dt: Optional[datetime] = None, doprint: bool = False):
         """
@@ -87,7 +167,7 @@ class BaseStrategy(bt.Strategy):
         - doprint: 是否强制打印（忽略 printlog 参数）
         """
         if self.params.printlog or doprint:
-            dt = dt or self.datas[0].datetime.date(0)
+            dt = dt or self.get_current_date()
             print(f'{dt.isoformat()}, {txt}')
     
     def notify_order(self, order):
@@ -98,60 +178,18 @@ class BaseStrategy(bt.Strategy):
         
         if order.status in [order.Completed]:
             if order.isbuy():
-                # 计算实际手续费（order.executed.comm 是总费用，但买入时只有手续费）
-                commission = order.executed.comm
-                self.log(
-                    f'买入执行, 价格: {order.executed.price:.2f}, '
-                    f'数量: {order.executed.size}, '
-                    f'成本: {order.executed.value:.2f}, '
-                    f'手续费: {commission:.2f}'
-                )
-                # 记录买入日期（用于 T+1 检查）
-                self._buy_dates.append(self.data.datetime.date(0))
+                # 记录买入日期（用于 T+1 检查）；只有当天的买入影响卖出，更早的日期直接丢弃
+                today = self.get_current_date()
+                if today not in self._buy_dates:
+                    self._buy_dates.clear()
+                    self._buy_dates.add(today)
                 self.buy_order = None
             elif order.issell():
-                # 计算手续费和印花税
-                # order.executed.comm 是总费用（手续费+印花税）
-                total_cost = order.executed.comm
-                value = abs(order.executed.size) * order.executed.price
-                
-                # 反推手续费和印花税
-                # 手续费 = value * commission_rate，但不少于 min_commission
-                # 印花税 = value * stamp_tax_rate
-                # 总费用 = 手续费 + 印花税
-                
-                # 从 CommInfo 获取参数（需要访问 broker 的 comminfo）
-                try:
-                    comminfo = self.broker.getcommissioninfo(self.data)
-                    commission_rate = comminfo.p.commission
-                    stamp_tax_rate = comminfo.p.stamp_tax
-                    min_commission = comminfo.p.min_commission
-                    
-                    # 计算手续费
-                    commission = value * commission_rate
-                    if commission < min_commission:
-                        commission = min_commission
-                    
-                    # 计算印花税
-                    stamp_tax = value * stamp_tax_rate
-                    
-                    self.log(
-                        f'卖出执行, 价格: {order.executed.price:.2f}, '
-                        f'数量: {order.executed.size}, '
-                        f'成本: {order.executed.value:.2f}, '
-                        f'手续费: {commission:.2f}, '
-                        f'印花税: {stamp_tax:.2f}, '
-                        f'总费用: {total_cost:.2f}'
-                    )
-                except:
-                    # 如果无法获取详细信息，只显示总费用
-                    self.log(
-                        f'卖出执行, 价格: {order.executed.price:.2f}, '
-                        f'数量: {order.executed.size}, '
-                        f'成本: {order.executed.value:.2f}, '
-                        f'总费用: {total_cost:.2f}'
-                    )
                 self.sell_order = None
+            
+            # 不打印日志时跳过费用计算和字符串格式化
+            if self.params.printlog:
+                self._log_order_execution(order)
         
         elif order.status in [order.Canceled, order.Margin, order.Rejected]:
             self.log(f'订单 {order.status}')
@@ -164,9 +202,52 @@ class BaseStrategy(bt.Strategy):
         if order == self.sell_order:
             self.sell_order = None
     
+    def _log_order_execution(self, order):
+        """打印成交日志（买入显示手续费，卖出拆分手续费和印花税）"""
+        executed = order.executed
+        price = executed.price
+        size = executed.size
+        # 前缀：价格、数量、成本
+        head = f'价格: {price:.2f}, 数量: {size}, 成本: {executed.value:.2f}'
+        
+        if order.isbuy():
+            # 买入时 executed.comm 只有手续费
+            self.log(f'买入执行, {head}, 手续费: {executed.comm:.2f}')
+            return
+        
+        # 计算手续费和印花税
+        # executed.comm 是总费用（手续费+印花税）
+        total_cost = executed.comm
+        value = abs(size) * price
+        
+        # 反推手续费和印花税
+        # 手续费 = value * commission_rate，但不少于 min_commission
+        # 印花税 = value * stamp_tax_rate
+        # 总费用 = 手续费 + 印花税
+        
+        # 使用 start() 时缓存的 CommInfo 参数
+        if self._fee_rates is not None:
+            commission_rate, stamp_tax_rate, min_commission = self._fee_rates
+            
+            # 计算手续费（不低于最小手续费）
+            commission = max(value * commission_rate, min_commission)
+            
+            # 计算印花税
+            stamp_tax = value * stamp_tax_rate
+            
+            self.log(
+                f'卖出执行, {head}, '
+                f'手续费: {commission:.2f}, '
+                f'印花税: {stamp_tax:.2f}, '
+                f'总费用: {total_cost:.2f}'
+            )
+        else:
+            # CommInfo 没有印花税等参数（非 ChinaStockCommInfo），只显示总费用
+            self.log(f'卖出执行, {head}, 总费用: {total_cost:.2f}')
+    
     def notify_trade(self, trade):
         """交易通知"""
-        if not trade.isclosed:
+        if not trade.isclosed or not self.params.printlog:
             return
         
         self.log(
@@ -193,6 +274,18 @@ class BaseStrategy(bt.Strategy):
         """获取当前成交量"""
         return self.data.volume[0]
     
+    def get_current_date(self) -> date:
+        """
+        获取当前 K 线的日期
+        
+        按 K 线数量缓存，同一根 K 线内多次调用（日志、T+1 检查、指标存储）只转换一次时间戳
+        """
+        bar_len = len(self.data)
+        if bar_len != self._current_date_len:
+            self._current_date = self.data.datetime.date(0)
+            self._current_date_len = bar_len
+        return self._current_date
+    
     def get_history_prices(self, lookback: int = 30) -> List[float]:
         """
         获取历史价格列表
@@ -203,11 +296,8 @@ class BaseStrategy(bt.Strategy):
         返回:
         价格列表（从旧到新）
         """
-        prices = []
-        for i in range(lookback, -1, -1):
-            if len(self.data.close) > i:
-                prices.append(self.data.close[-i])
-        return prices
+        size = min(lookback + 1, _available_bars(self.data))
+        return np.asarray(self.data.close.get(size=size), dtype=np.float64).tolist()
     
     def get_history_data(self, lookback: int = 30) -> Dict[str, List]:
         """
@@ -219,69 +309,30 @@ class BaseStrategy(bt.Strategy):
         返回:
         包含 open, high, low, close, volume, datetime 的字典
         """
+        # 最近 lookback + 1 根 K 线（含当前 K 线），直接切片底层数组
+        # （exactbars 模式下 get() 返回 list，统一用 np.asarray 转换）
+        size = min(lookback + 1, _available_bars(self.data))
         data = {
-            'open': [],
-            'high': [],
-            'low': [],
-            'close': [],
-            'volume': [],
-            'datetime': []
+            line_name: np.asarray(getattr(self.data, line_name).get(size=size), dtype=np.float64).tolist()
+            for line_name in _OHLCV_LINES
         }
-        
-        for i in range(lookback, -1, -1):
-            if len(self.data.close) > i:
-                data['open'].append(self.data.open[-i])
-                data['high'].append(self.data.high[-i])
-                data['low'].append(self.data.low[-i])
-                data['close'].append(self.data.close[-i])
-                data['volume'].append(self.data.volume[-i])
-                data['datetime'].append(self.data.datetime.datetime(-i))
+        datetimes = np.asarray(self.data.datetime.get(size=size), dtype=np.float64)
+        data['datetime'] = list(num2date_array(datetimes).to_pydatetime())
         
         return data
     
-    def get_full_dataframe(self) -> pd.DataFrame:
+    def get_full_dataframe(self, data: Optional[bt.LineSeries] = None) -> pd.DataFrame:
         """
         获取完整的股票数据 DataFrame
         
+        参数:
+        - data: 数据源（可选），默认使用主数据源
+        
         返回:
-        包含所有历史数据的 DataFrame，索引为日期，列为 open, high, low, close, volume
-        """
-        # 如果已经初始化，直接返回缓存
-        if self._dataframe_initialized and self._full_dataframe is not None:
-            return self._full_dataframe
-        
-        # 构建 DataFrame
-        data_list = []
-        current_idx = 0
-        
-        # 从最早的数据开始收集
-        while current_idx < len(self.data.close):
-            try:
-                dt = self.data.datetime.datetime(-current_idx - 1)
-                data_list.append({
-                    'datetime': dt,
-                    'date': dt.date(),
-                    'open': self.data.open[-current_idx - 1],
-                    'high': self.data.high[-current_idx - 1],
-                    'low': self.data.low[-current_idx - 1],
-                    'close': self.data.close[-current_idx - 1],
-                    'volume': self.data.volume[-current_idx - 1],
-                })
-                current_idx += 1
-            except (IndexError, AttributeError):
-                break
-        
-        # 创建 DataFrame
-        df = pd.DataFrame(data_list)
-        if not df.empty:
-            df.set_index('date', inplace=True)
-            df.sort_index(inplace=True)
-        
-        # 缓存结果
-        self._full_dataframe = df
-        self._dataframe_initialized = True
-        
-        return df
+        截至当前 K 线（含）的全部数据，索引为日期，列为 datetime, open, high, low, close, volume
+        """
+        # 同一根 K 线内重复调用直接使用数据源上的缓存
+        return _lines_to_dataframe(self.data if data is None else data)
     
     def get_all_data(self) -> pd.DataFrame:
         """
@@ -303,6 +354,7 @@ class BaseStrategy(bt.Strategy):
         
         注意：
         - 默认按日期存储，便于按时间序列获取指标
+        - 日期键统一为 datetime.date：date 直接使用，datetime/pd.Timestamp 取日期部分，字符串按日期解析
         - 如果之前存储的是非日期格式，会自动转换为日期格式
         
         示例:
@@ -314,30 +366,40 @@ class BaseStrategy(bt.Strategy):
         """
         # 如果没有指定日期，使用当前数据的日期
         if date is None:
-            date = self.data.datetime.date(0)
+            date = self.get_current_date()
+        
+        date_key = self._to_date_key(date)
         
         # 确保指标以日期格式存储
-        if name not in self.indicators:
-            self.indicators[name] = {}
-        elif not isinstance(self.indicators[name], dict):
-            # 如果之前存储的是非字典格式，转换为日期格式
-            old_value = self.indicators[name]
-            self.indicators[name] = {}
-            # 如果有旧值，可以保存到当前日期（可选）
-            # self.indicators[name][self.data.datetime.date(0)] = old_value
-        
-        # 转换为日期键
-        if isinstance(date, pd.Timestamp):
-            date_key = date.date()
-        elif isinstance(date, datetime):
-            date_key = date.date()
-        elif isinstance(date, str):
-            date_key = pd.Timestamp(date).date()
-        else:
-            date_key = date
+        history = self.indicators.get(name)
+        if not isinstance(history, dict):
+            # 首次设置，或之前存储的是非字典格式（直接赋值），转换为日期格式
+            history = self.indicators[name] = {}
+            self._latest_indicators.pop(name, None)
         
         # 存储指标（按日期）
-        self.indicators[name][date_key] = value
+        history[date_key] = value
+        self._history_series_cache.pop(name, None)
+        
+        # 更新最新值；补写更早日期时最新值不变，并重新排序以保持字典按日期有序
+        latest = self._latest_indicators.get(name)
+        if latest is None or date_key >= latest[0]:
+            self._latest_indicators[name] = (date_key, value)
+        elif len(history) > 1:
+            self.indicators[name] = dict(sorted(history.items()))
+    
+    @staticmethod
+    def _to_date_key(value) -> any:
+        """把日期参数转换为指标字典的日期键（datetime.date）"""
+        # 最常见的情况（get_current_date 返回的 date）直接返回
+        if type(value) is date:
+            return value
+        if isinstance(value, datetime):
+            # 包括 pd.Timestamp
+            return value.date()
+        if isinstance(value, str):
+            return _str_to_date(value)
+        return value
     
     def get_indicator(self, name: str, date: Optional[datetime] = None, default: any = None) -> any:
         """
@@ -369,22 +431,16 @@ class BaseStrategy(bt.Strategy):
         
         if date is not None:
             # 获取指定日期的指标
-            if isinstance(date, pd.Timestamp):
-                date_key = date.date()
-            elif isinstance(date, datetime):
-                date_key = date.date()
-            elif isinstance(date, str):
-                date_key = pd.Timestamp(date).date()
-            else:
-                date_key = date
-            
-            return indicator.get(date_key, default)
-        else:
-            # 获取最新指标（最近的日期）
-            if len(indicator) > 0:
-                latest_date = max(indicator.keys())
-                return indicator[latest_date]
-            return default
+            return indicator.get(self._to_date_key(date), default)
+        
+        # 获取最新指标（最近的日期）
+        latest = self._latest_indicators.get(name)
+        if latest is not None:
+            return latest[1]
+        if len(indicator) > 0:
+            # 直接写入 self.indicators 的字典（没有经过 set_indicator），按写入顺序取最后一个
+            return indicator[next(reversed(indicator))]
+        return default
     
     def get_indicator_history(self, name: str, as_list: bool = False) -> any:
         """
@@ -421,15 +477,96 @@ class BaseStrategy(bt.Strategy):
         if len(indicator) == 0:
             return [] if as_list else {}
         
-        # 按日期排序
-        sorted_items = sorted(indicator.items())
-        
+        # set_indicator 保证字典按日期有序，无需再排序
         if as_list:
             # 返回列表格式
-            return sorted_items
+            return list(indicator.items())
         else:
-            # 返回字典格式（保持排序）
-            return dict(sorted_items)
+            # 返回字典格式（副本，避免调用方修改内部存储）
+            return dict(indicator)
+    
+    def get_indicator_history_series(self, name: str) -> pd.Series:
+        """
+        获取指标的历史值（pd.Series 格式）
+        
+        参数:
+        - name: 指标名称
+        
+        返回:
+        pd.Series，索引为日期（DatetimeIndex，名称 'date'），按日期排序；指标不存在时返回空 Series
+        
+        注意:
+        - 一次性由键/值列表构造，结果会缓存到下一次 set_indicator 写入该指标为止
+        
+        示例:
+        chip_peak = self.get_indicator_history_series('chip_peak')
+        chip_peak.rolling(5).mean()
+        """
+        series = self._history_series_cache.get(name)
+        if series is None:
+            history = self.indicators.get(name)
+            if not isinstance(history, dict):
+                history = {}
+            series = pd.Series(
+                list(history.values()),
+                index=pd.DatetimeIndex(list(history.keys()), name='date'),
+                name=name,
+                dtype=None if history else float
+            )
+            self._history_series_cache[name] = series
+        # 浅拷贝，调用方修改时不影响缓存
+        return series.copy(deep=False)
+    
+    def set_indicator_series(self, name: str, value: float):
+        """
+        设置当前 K 线的数值指标（按 K 线序号存入 float64 数组）
+        
+        参数:
+        - name: 指标名称
+        - value: 指标值（标量数值）
+        
+        注意:
+        - 适合每根 K 线一个数值的指标（如 RSI），比按日期存储的字典节省内存
+        - 数组按数据总长度预分配，未设置的位置为 NaN
+        - 非数值或稀疏的指标请使用 set_indicator
+        
+        示例:
+        self.set_indicator_series('rsi', rsi_value)
+        """
+        index = len(self.data) - 1
+        series = self.indicator_series.get(name)
+        if series is None:
+            # 预加载时 buflen() 即数据总长度
+            series = np.full(max(self.data.buflen(), index + 1), np.nan)
+            self.indicator_series[name] = series
+        elif index >= len(series):
+            # 未预加载（数据逐根加载）时按需扩容
+            grown = np.full(max(index + 1, 2 * len(series)), np.nan)
+            grown[:len(series)] = series
+            series = self.indicator_series[name] = grown
+        series[index] = value
+    
+    def get_indicator_series(self, name: str) -> Optional[np.ndarray]:
+        """
+        获取数值指标从第一根 K 线到当前 K 线的值
+        
+        参数:
+        - name: 指标名称
+        
+        返回:
+        np.ndarray（当前 K 线为最后一个元素，只读视图），指标不存在时返回 None
+        
+        示例:
+        rsi = self.get_indicator_series('rsi')
+        if rsi is not None and rsi[-1] > 70:
+            ...
+        """
+        series = self.indicator_series.get(name)
+        if series is None:
+            return None
+        view = series[:len(self.data)]
+        view.flags.writeable = False
+        return view
     
     def has_indicator(self, name: str) -> bool:
         """
@@ -442,7 +579,7 @@ class BaseStrategy(bt.Strategy):
         - True: 指标存在
         - False: 指标不存在
         """
-        return name in self.indicators
+        return name in self.indicators or name in self.indicator_series
     
     def list_indicators(self) -> List[str]:
         """
@@ -451,7 +588,9 @@ class BaseStrategy(bt.Strategy):
         返回:
         指标名称列表
         """
-        return list(self.indicators.keys())
+        return list(self.indicators.keys()) + [
+            name for name in self.indicator_series if name not in self.indicators
+        ]
     
     def clear_indicator(self, name: Optional[str] = None):
         """
@@ -462,8 +601,14 @@ class BaseStrategy(bt.Strategy):
         """
         if name is None:
             self.indicators.clear()
-        elif name in self.indicators:
-            del self.indicators[name]
+            self._latest_indicators.clear()
+            self.indicator_series.clear()
+            self._history_series_cache.clear()
+        else:
+            self.indicators.pop(name, None)
+            self._latest_indicators.pop(name, None)
+            self.indicator_series.pop(name, None)
+            self._history_series_cache.pop(name, None)
     
     def _init_data_map(self):
         """初始化数据源映射"""
@@ -631,13 +776,15 @@ class BaseStrategy(bt.Strategy):
     
     def get_synced_data_by_frequency(
         self,
-        frequency: str
+        frequency: str,
+        lookback: Optional[int] = None
     ) -> pd.DataFrame:
         """
         获取指定频率的股票数据，并与 backtrader 当前时间点同步
         
         参数:
         - frequency: 数据频率，如 "d"（日线）、"5"（5分钟）、"15"（15分钟）等
+        - lookback: 只返回最近 lookback 根 K 线（可选），None 表示返回全部历史
         
         返回:
         DataFrame，包含指定频率的股票数据，数据截止到 backtrader 当前时间点
@@ -647,6 +794,7 @@ class BaseStrategy(bt.Strategy):
         - 返回的数据只包含到当前 backtrader 时间点的数据（历史数据）
         - 可以在 next() 中调用，获取其他频率的同步数据进行计算
         - 数据从引擎缓存中获取，无需重复加载
+        - 缓存数据已按时间排序，截取使用二分查找（O(log n)），返回的是缓存的切片，请勿原地修改
         
         示例:
         # 在 next() 中获取5分钟数据（与当前时间点同步）
@@ -666,24 +814,22 @@ class BaseStrategy(bt.Strategy):
         if frequency not in data_cache:
             raise ValueError(f"频率 '{frequency}' 的数据未找到，可用频率: {list(data_cache.keys())}")
         
-        df = data_cache[frequency].copy()
+        df = data_cache[frequency]
         
         if df.empty:
             return df
         
         # 获取当前 backtrader 时间点
         current_datetime = self.data.datetime.datetime(0)
-        current_date = current_datetime.date() if hasattr(current_datetime, 'date') else current_datetime
         
-        # 根据频率类型，过滤数据到当前时间点
+        # 根据频率类型，截取数据到当前时间点
         if frequency == 'd':
-            # 日线数据：过滤到当前日期
-            df = df[df.index.date <= current_date]
-        else:
-            # 分钟线数据：过滤到当前日期时间
-            df = df[df.index <= current_datetime]
+            # 日线数据：截取到当前日期（不含次日 0 点）
+            next_day = pd.Timestamp(current_datetime).normalize() + pd.Timedelta(days=1)
+            return slice_until(df, next_day, lookback=lookback, side='left')
         
-        return df
+        # 分钟线数据：截取到当前日期时间
+        return slice_until(df, current_datetime, lookback=lookback)
     
     def get_data(self, name: Optional[str] = None) -> bt.LineSeries:
         """
@@ -705,12 +851,12 @@ class BaseStrategy(bt.Strategy):
         weekly_data = self.get_data("000651_w")
         weekly_price = weekly_data.close[0]
         """
-        # 初始化数据源映射
-        self._init_data_map()
-        
         if name is None:
             return self.data
         
+        # 按名称查找时才初始化数据源映射
+        self._init_data_map()
+        
         if name in self._data_map:
             return self._data_map[name]
         
@@ -734,34 +880,7 @@ class BaseStrategy(bt.Strategy):
         返回:
         完整的 DataFrame
         """
-        data = self.get_data(name)
-        
-        # 构建 DataFrame
-        data_list = []
-        current_idx = 0
-        
-        while current_idx < len(data.close):
-            try:
-                dt = data.datetime.datetime(-current_idx - 1)
-                data_list.append({
-                    'datetime': dt,
-                    'date': dt.date(),
-                    'open': data.open[-current_idx - 1],
-                    'high': data.high[-current_idx - 1],
-                    'low': data.low[-current_idx - 1],
-                    'close': data.close[-current_idx - 1],
-                    'volume': data.volume[-current_idx - 1],
-                })
-                current_idx += 1
-            except (IndexError, AttributeError):
-                break
-        
-        df = pd.DataFrame(data_list)
-        if not df.empty:
-            df.set_index('date', inplace=True)
-            df.sort_index(inplace=True)
-        
-        return df
+        return _lines_to_dataframe(self.get_data(name))
     
     def list_data_sources(self) -> List[str]:
         """
@@ -784,8 +903,7 @@ class BaseStrategy(bt.Strategy):
         if not self.position or self.position.size <= 0:
             return True  # 没有持仓，可以卖出（做空场景，但A股不支持）
         
-        current_date = self.data.datetime.date(0)
-        return current_date not in self._buy_dates
+        return self.get_current_date() not in self._buy_dates
     
     def buy(self, size: Optional[float] = None, price: Optional[float] = None,
             exectype: Optional[int] = None,
@@ -895,16 +1013,14 @@ class BaseStrategy(bt.Strategy):
             size = int(abs(self.position.size) * position_ratio)
         else:
             # 按现金比例买入
-            cash = self.broker.getcash()
+            if cash_ratio <= 0:
+                return 0
             price = self.get_current_price()
             if price <= 0:
                 return 0
             
-            # 计算可用资金
-            available_cash = cash * cash_ratio
-            
-            # 计算可买数量
-            size = int(available_cash / price)
+            # 可买数量按最小交易单位向下取整
+            return max(0, int(self.broker.getcash() * cash_ratio / price) // min_size * min_size)
         
         # 按最小交易单位取整（A股是100股为1手）
         size = (size // min_size) * min_size
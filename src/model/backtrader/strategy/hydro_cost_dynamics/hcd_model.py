@@ -2,8 +2,178 @@
 HCD (Hydro-Cost Dynamics) 模型
 基于资金能流分析的五维参数计算模型
 """
+import math
+from collections import deque
+from typing import Any, Dict, Hashable
+
+import numpy as np
 import pandas as pd
 
+from utils._njit import NUMBA_AVAILABLE, njit, prange
+
+
+def _decay_accumulate_blocked(net_flow: np.ndarray, decay: float, block: int = 1024) -> np.ndarray:
+    """
+    带衰减的累积：out[0] = net_flow[0]，out[i] = out[i-1] * decay + net_flow[i]
+    
+    未安装 numba 时使用（安装时由 _hcd_kernel 逐项递推），避免 Python 逐行循环；
+    利用闭式解 out[j] = decay^(j+1) * (carry + cumsum(x[k] / decay^(k+1)))，
+    分块计算以避免 decay 的高次幂下溢/上溢，块间只传递上一块的最后一个值
+    """
+    out = np.empty_like(net_flow)
+    if net_flow.size == 0:
+        return out
+    if decay == 0:
+        out[:] = net_flow
+        return out
+    
+    # 块内 decay 的幂控制在 1e±150 以内
+    magnitude = abs(np.log10(abs(decay)))
+    if magnitude > 0:
+        block = max(1, min(block, int(150 / magnitude)))
+    powers = decay ** np.arange(1, block + 1, dtype=np.float64)
+    
+    carry = 0.0
+    for start in range(0, net_flow.size, block):
+        chunk = net_flow[start:start + block]
+        scale = powers[:chunk.size]
+        segment = scale * (carry + np.cumsum(chunk / scale))
+        out[start:start + chunk.size] = segment
+        carry = segment[-1]
+    return out
+
+
+@njit(cache=True, error_model='numpy')
+def _hcd_kernel(open_, close, volume, window, decay):
+    """
+    单次遍历计算 calculate_indicators 的全部指标列（与 _calculate_columns 的 NumPy 实现结果一致）
+    
+    滚动窗口（min_periods=1）的和用前缀和相减得到（同 _rolling_sum）：窗口内全为 0 时
+    （如停牌期间成交量为 0）和精确为 0，不会残留增减抵消的舍入误差；
+    VWAP 的分子、分母与 pandas rolling().sum() 一样跳过 NaN
+    
+    返回:
+    (mef, flow_in, flow_out, m_pool, f_in, f_out, trend, vwap, deviation)
+    """
+    n = close.size
+    mef = np.empty(n)
+    flow_in = np.empty(n)
+    flow_out = np.empty(n)
+    m_pool = np.empty(n)
+    f_in = np.empty(n)
+    f_out = np.empty(n)
+    trend = np.empty(n)
+    vwap = np.empty(n)
+    deviation = np.empty(n)
+    
+    # 前缀和：下标 i 为前 i 根 K 线之和（NaN 按 0 计入，个数另行统计）
+    prefix_in = np.zeros(n + 1)
+    prefix_out = np.zeros(n + 1)
+    prefix_pv = np.zeros(n + 1)
+    prefix_v = np.zeros(n + 1)
+    prefix_count_pv = np.zeros(n + 1, dtype=np.int64)
+    prefix_count_v = np.zeros(n + 1, dtype=np.int64)
+    
+    for i in range(n):
+        # 资金能流与注水/抽水流量（NaN 视为 0）
+        m = volume[i] * (close[i] - open_[i]) / open_[i]
+        mef[i] = m
+        flow_in[i] = m if m > 0 else 0.0
+        flow_out[i] = m if m < 0 else 0.0
+        
+        # 水池深度：带衰减的累积
+        net = flow_in[i] + flow_out[i]
+        m_pool[i] = net if i == 0 else m_pool[i - 1] * decay + net
+        
+        # 前缀和
+        prefix_in[i + 1] = prefix_in[i] + flow_in[i]
+        prefix_out[i + 1] = prefix_out[i] - flow_out[i]
+        pv = close[i] * volume[i]
+        if np.isnan(pv):
+            prefix_pv[i + 1] = prefix_pv[i]
+            prefix_count_pv[i + 1] = prefix_count_pv[i]
+        else:
+            prefix_pv[i + 1] = prefix_pv[i] + pv
+            prefix_count_pv[i + 1] = prefix_count_pv[i] + 1
+        if np.isnan(volume[i]):
+            prefix_v[i + 1] = prefix_v[i]
+            prefix_count_v[i + 1] = prefix_count_v[i]
+        else:
+            prefix_v[i + 1] = prefix_v[i] + volume[i]
+            prefix_count_v[i + 1] = prefix_count_v[i] + 1
+        
+        # 当前窗口为第 start..i 根 K 线
+        start = max(i + 1 - window, 0)
+        size = i + 1 - start
+        f_in[i] = (prefix_in[i + 1] - prefix_in[start]) / size
+        f_out[i] = (prefix_out[i + 1] - prefix_out[start]) / size
+        
+        # 水位趋势：与 window 根 K 线之前的水池深度之差（不足 window 根时按 0）
+        trend[i] = m_pool[i] - (m_pool[i - window] if i >= window else 0.0)
+        
+        # 成交量加权平均价与水位偏差（窗口内全为 NaN 时为 NaN）
+        numerator = np.nan
+        if prefix_count_pv[i + 1] > prefix_count_pv[start]:
+            numerator = prefix_pv[i + 1] - prefix_pv[start]
+        denominator = np.nan
+        if prefix_count_v[i + 1] > prefix_count_v[start]:
+            denominator = prefix_v[i + 1] - prefix_v[start]
+        vwap[i] = numerator / denominator
+        deviation[i] = (close[i] - vwap[i]) / vwap[i]
+    
+    return mef, flow_in, flow_out, m_pool, f_in, f_out, trend, vwap, deviation
+
+
+def _rolling_sum(values: np.ndarray, window: int):
+    """
+    滚动窗口求和（等价于 rolling(window, min_periods=1).sum()，跳过 NaN）
+    
+    用前缀和相减得到每个窗口的和，O(N) 且没有 pandas rolling 的额外开销
+    
+    返回:
+    (窗口和, 窗口内非 NaN 个数)，窗口内全为 NaN 时和为 NaN
+    """
+    valid = ~np.isnan(values)
+    prefix = np.concatenate(([0.0], np.cumsum(np.where(valid, values, 0.0))))
+    prefix_count = np.concatenate(([0], np.cumsum(valid)))
+    
+    end = np.arange(1, values.size + 1)
+    start = np.maximum(end - window, 0)
+    sums = prefix[end] - prefix[start]
+    counts = prefix_count[end] - prefix_count[start]
+    sums[counts == 0] = np.nan
+    return sums, counts
+
+
+def _nan_to_zero(values: np.ndarray) -> np.ndarray:
+    """NaN 替换为 0（返回新数组，±inf 保持不变，与 Series.fillna(0) 一致）"""
+    return np.where(np.isnan(values), 0.0, values)
+
+
+# calculate_indicators 新增的列（按 _hcd_kernel 的返回顺序）
+_INDICATOR_COLUMNS = ('mef', 'flow_in', 'flow_out', 'm_pool', 'f_in', 'f_out', 'trend', 'vwap', 'deviation')
+
+
+@njit(cache=True, parallel=True, error_model='numpy')
+def _hcd_kernel_batch(open_, close, volume, lengths, window, decay):
+    """
+    多只股票并行执行 _hcd_kernel
+    
+    输入为 (股票数, 最大长度) 的二维数组，第 s 行只有前 lengths[s] 个值有效；
+    返回 (指标数, 股票数, 最大长度) 的数组，指标顺序同 _INDICATOR_COLUMNS
+    """
+    n_symbols, max_len = close.shape
+    out = np.full((len(_INDICATOR_COLUMNS), n_symbols, max_len), np.nan)
+    for s in prange(n_symbols):
+        n = lengths[s]
+        columns = _hcd_kernel(open_[s, :n], close[s, :n], volume[s, :n], window, decay)
+        for k in range(len(columns)):
+            out[k, s, :n] = columns[k]
+    return out
+
+# generate_signals 输出的信号类别（'signal' 列为 Categorical，编码依次为 0/1/2）
+SIGNAL_CATEGORIES = ['WAIT', 'BUY', 'SELL']
+
 
 class HCDModel:
     """
@@ -12,6 +182,7 @@ class HCDModel:
     核心功能：
     1. 计算五维参数体系
     2. 生成交易信号
+    3. 逐根 K 线增量更新（update），回测中每根 K 线 O(1)
     
     五维参数：
     ① 水池深度 (M_pool): 主力底仓的有效堆积量
@@ -41,6 +212,106 @@ class HCDModel:
         self.decay_factor = decay_factor
         self.coverage_coefficient = coverage_coefficient
         self.max_deviation = max_deviation
+        self.reset()
+    
+    def reset(self):
+        """清空 update() 的增量计算状态"""
+        self._bar_count = 0
+        self._m_pool = 0.0
+        # 截至最新 K 线的前缀和 (flow_in, -flow_out, close * volume, volume) 与非 NaN 个数 (pv, volume)，
+        # 窗口和 = 当前前缀和 - 窗口起点之前的前缀和（同 _hcd_kernel）
+        self._prefix = (0.0, 0.0, 0.0, 0.0, 0, 0)
+        # 最近 window 根 K 线各自的 (前缀和, m_pool)
+        self._window_bars = deque()
+    
+    def update(self, open_: float, close: float, volume: float) -> Dict[str, Any]:
+        """
+        输入一根新 K 线，增量计算它的五维参数和交易信号
+        
+        参数:
+        - open_, close, volume: 新 K 线的开盘价、收盘价、成交量
+        
+        返回:
+        字典，包含 calculate_indicators 新增的各列（mef, flow_in, flow_out, m_pool, f_in, f_out,
+        trend, vwap, deviation）和 'signal'
+        
+        注意:
+        - 结果与对截至这根 K 线的全部数据调用 calculate_indicators + generate_signals 的最后一行相同，
+          但每次只处理一根 K 线（窗口和由前缀和相减得到，计算顺序与 _hcd_kernel 一致）
+        - 从头重新输入前先调用 reset()
+        
+        示例:
+        model = HCDModel()
+        for row in df.itertuples():
+            latest = model.update(row.open, row.close, row.volume)
+        """
+        window = self.window
+        open_ = np.float64(open_)
+        close = np.float64(close)
+        volume = np.float64(volume)
+        
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # 资金能流与注水/抽水流量（NaN 视为 0）
+            mef = volume * (close - open_) / open_
+            flow_in = mef if mef > 0 else 0.0
+            flow_out = mef if mef < 0 else 0.0
+            
+            # 水池深度：带衰减的累积
+            net = flow_in + flow_out
+            m_pool = net if self._bar_count == 0 else self._m_pool * self.decay_factor + net
+            
+            # 前缀和：加入新 K 线（NaN 按 0 计入，个数另行统计）
+            prefix_in, prefix_out, prefix_pv, prefix_v, count_pv, count_v = self._prefix
+            pv = close * volume
+            prefix_in = prefix_in + flow_in
+            prefix_out = prefix_out - flow_out
+            if not math.isnan(pv):
+                prefix_pv = prefix_pv + pv
+                count_pv += 1
+            if not math.isnan(volume):
+                prefix_v = prefix_v + volume
+                count_v += 1
+            prefix = (prefix_in, prefix_out, prefix_pv, prefix_v, count_pv, count_v)
+            
+            # 窗口起点之前的前缀和（不足 window 根时为 0），以及 window 根 K 线之前的水池深度
+            self._window_bars.append((prefix, m_pool))
+            start, previous_m_pool = (0.0, 0.0, 0.0, 0.0, 0, 0), 0.0
+            if len(self._window_bars) > window:
+                start, previous_m_pool = self._window_bars.popleft()
+            
+            self._bar_count += 1
+            self._m_pool = m_pool
+            self._prefix = prefix
+            
+            size = min(self._bar_count, window)
+            f_in = (prefix_in - start[0]) / size
+            f_out = (prefix_out - start[1]) / size
+            
+            # 水位趋势：与 window 根 K 线之前的水池深度之差（不足 window 根时按 0）
+            trend = m_pool - previous_m_pool
+            
+            # 成交量加权平均价与水位偏差（窗口内全为 NaN 时为 NaN）
+            numerator = prefix_pv - start[2] if count_pv > start[4] else np.nan
+            denominator = prefix_v - start[3] if count_v > start[5] else np.nan
+            vwap = np.float64(numerator) / np.float64(denominator)
+            deviation = (close - vwap) / vwap
+        
+        # 信号判定同 generate_signals（NaN 按 0 处理，同时满足时卖出优先）
+        t = 0.0 if math.isnan(trend) else trend
+        fi = 0.0 if math.isnan(f_in) else f_in
+        fo = 0.0 if math.isnan(f_out) else f_out
+        dev = 0.0 if math.isnan(deviation) else deviation
+        if t < 0 or fo > fi * 1.5:
+            signal = 'SELL'
+        elif t > 0 and fi > fo and abs(dev) < self.max_deviation:
+            signal = 'BUY'
+        else:
+            signal = 'WAIT'
+        
+        values = (mef, flow_in, flow_out, m_pool, f_in, f_out, trend, vwap, deviation)
+        result = {name: float(value) for name, value in zip(_INDICATOR_COLUMNS, values)}
+        result['signal'] = signal
+        return result
     
     def calculate_indicators(self, df: pd.DataFrame) -> pd.DataFrame:
         """
@@ -50,7 +321,7 @@ class HCDModel:
         - df: DataFrame，必须包含列：['open', 'high', 'low', 'close', 'volume']
         
         输出:
-        - DataFrame，新增以下列：
+        - DataFrame（保留输入的索引和列），新增以下列：
             - 'm_pool': 水池深度 (Pool Depth) - ①
             - 'f_in': 注水力度 (Injection Force) - ②
             - 'f_out': 抽水力度 (Extraction Force) - ③
@@ -59,39 +330,104 @@ class HCDModel:
         """
         if df.empty:
             return df.copy()
+        if self.window < 1:
+            raise ValueError(f"window 必须为正整数，当前为 {self.window}")
         
-        # 确保索引是连续的（用于 shift 操作）
-        df = df.copy().reset_index(drop=True)
+        # 只读取需要的列（数值列为 float64 时不复制），指标在数组上计算后一次性加到结果中
+        open_ = df['open'].to_numpy(dtype=np.float64)
+        close = df['close'].to_numpy(dtype=np.float64)
+        volume = df['volume'].to_numpy(dtype=np.float64)
+        
+        if NUMBA_AVAILABLE:
+            # 安装了 numba 时所有指标在一个编译后的循环中一次算出
+            columns = _hcd_kernel(open_, close, volume, int(self.window), float(self.decay_factor))
+        else:
+            columns = self._calculate_columns(open_, close, volume)
+        
+        return df.assign(**dict(zip(_INDICATOR_COLUMNS, columns)))
+    
+    def calculate_indicators_batch(self, frames: Dict[Hashable, pd.DataFrame]) -> Dict[Hashable, pd.DataFrame]:
+        """
+        批量计算多只股票的五维参数（结果与逐只调用 calculate_indicators 相同）
+        
+        输入:
+        - frames: {股票代码: DataFrame}，每个 DataFrame 的要求同 calculate_indicators
+        
+        输出:
+        - {股票代码: 指标 DataFrame}，顺序与输入一致
+        
+        注意:
+        - 安装了 numba 时各股票在一次调用中多线程并行计算；否则逐只计算
+        - run_many() 的工作进程中 numba 线程数限制为 1，进程间已经并行
+        
+        示例:
+        frames = {code: get_stock_data(code, start, end) for code in codes}
+        indicators = model.calculate_indicators_batch(frames)
+        """
+        batch = [key for key, df in frames.items() if not df.empty]
+        if not NUMBA_AVAILABLE or len(batch) < 2 or self.window < 1:
+            return {key: self.calculate_indicators(df) for key, df in frames.items()}
+        
+        # 按最长的股票补齐为二维数组（补齐部分不参与计算）
+        lengths = np.array([len(frames[key]) for key in batch], dtype=np.int64)
+        shape = (len(batch), int(lengths.max()))
+        inputs = {name: np.zeros(shape) for name in ('open', 'close', 'volume')}
+        for row, key in enumerate(batch):
+            for name, array in inputs.items():
+                array[row, :lengths[row]] = frames[key][name].to_numpy(dtype=np.float64)
+        
+        out = _hcd_kernel_batch(
+            inputs['open'], inputs['close'], inputs['volume'], lengths,
+            int(self.window), float(self.decay_factor)
+        )
+        
+        rows = {key: row for row, key in enumerate(batch)}
+        results = {}
+        for key, df in frames.items():
+            if df.empty:
+                results[key] = df.copy()
+                continue
+            row = rows[key]
+            n = lengths[row]
+            results[key] = df.assign(**{name: out[k, row, :n] for k, name in enumerate(_INDICATOR_COLUMNS)})
+        return results
+    
+    def _calculate_columns(self, open_: np.ndarray, close: np.ndarray, volume: np.ndarray) -> tuple:
+        """calculate_indicators 的 NumPy 实现（未安装 numba 时使用），返回顺序同 _INDICATOR_COLUMNS"""
+        window = self.window
         
         # 1. 计算资金能流 (MEF) = Volume * (Close - Open) / Open
-        df['mef'] = df['volume'] * (df['close'] - df['open']) / df['open']
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mef = volume * (close - open_) / open_
         
-        # 2. 计算注水流量和抽水流量
-        df['flow_in'] = df['mef'].where(df['mef'] > 0, 0)  # 正能流 = 注水
-        df['flow_out'] = df['mef'].where(df['mef'] < 0, 0)  # 负能流 = 抽水
+        # 2. 计算注水流量和抽水流量（NaN 视为 0）
+        flow_in = np.where(mef > 0, mef, 0.0)  # 正能流 = 注水
+        flow_out = np.where(mef < 0, mef, 0.0)  # 负能流 = 抽水
         
         # 3. 计算水池深度 (M_pool) = 累积求和 (flow_in - flow_out)，带衰减因子
-        net_flow = df['flow_in'] + df['flow_out']  # flow_out 已经是负数
-        # 应用衰减因子：每个周期衰减一次（向量化计算）
-        df['m_pool'] = net_flow.copy()
-        for i in range(1, len(df)):
-            df.loc[i, 'm_pool'] = df.loc[i-1, 'm_pool'] * self.decay_factor + net_flow.iloc[i]
+        # flow_out 已经是负数；应用衰减因子：每个周期衰减一次
+        m_pool = _decay_accumulate_blocked(flow_in + flow_out, float(self.decay_factor))
         
         # 4. 计算注水力度 (F_in) = 正 flow_in 的滚动平均
-        df['f_in'] = df['flow_in'].rolling(window=self.window, min_periods=1).mean()
+        in_sum, in_count = _rolling_sum(flow_in, window)
+        f_in = in_sum / in_count
         
         # 5. 计算抽水力度 (F_out) = 负 flow_out 的绝对值的滚动平均
-        df['f_out'] = (-df['flow_out']).rolling(window=self.window, min_periods=1).mean()
+        out_sum, out_count = _rolling_sum(-flow_out, window)
+        f_out = out_sum / out_count
         
-        # 6. 计算水位趋势 (Trend) = m_pool - m_pool.shift(N)
-        df['trend'] = df['m_pool'] - df['m_pool'].shift(self.window).fillna(0)
+        # 6. 计算水位趋势 (Trend) = m_pool - m_pool.shift(N)（不足 N 根时按 0）
+        previous = np.zeros_like(m_pool)
+        previous[window:] = m_pool[:-window]
+        trend = m_pool - previous
         
         # 7. 计算水位偏差 (Deviation) = (close - vwap) / vwap
         # VWAP = 成交量加权平均价
-        df['vwap'] = (df['close'] * df['volume']).rolling(window=self.window, min_periods=1).sum() / df['volume'].rolling(window=self.window, min_periods=1).sum()
-        df['deviation'] = (df['close'] - df['vwap']) / df['vwap']
+        with np.errstate(divide='ignore', invalid='ignore'):
+            vwap = _rolling_sum(close * volume, window)[0] / _rolling_sum(volume, window)[0]
+            deviation = (close - vwap) / vwap
         
-        return df
+        return mef, flow_in, flow_out, m_pool, f_in, f_out, trend, vwap, deviation
     
     def generate_signals(self, df: pd.DataFrame) -> pd.DataFrame:
         """
@@ -101,7 +437,7 @@ class HCDModel:
         - df: DataFrame，必须包含计算后的指标列
         
         输出:
-        - DataFrame，新增 'signal' 列：
+        - DataFrame，新增 'signal' 列（Categorical，类别为 SIGNAL_CATEGORIES）：
             - 'BUY': 买入信号
             - 'SELL': 卖出信号
             - 'WAIT': 观望信号
@@ -110,35 +446,20 @@ class HCDModel:
         - BUY: (T_rend > 0) AND (F_in > F_out) AND (D_ev < 0.3)
         - SELL: (T_rend < 0) OR (F_out > F_in * 1.5)
         """
-        if df.empty:
-            df = df.copy()
-            df['signal'] = 'WAIT'
-            return df
-        
-        df = df.copy()
-        
-        # 初始化信号列为 WAIT
-        df['signal'] = 'WAIT'
-        
-        # 填充 NaN 值，避免条件判断出错
-        df['trend'] = df['trend'].fillna(0)
-        df['f_in'] = df['f_in'].fillna(0)
-        df['f_out'] = df['f_out'].fillna(0)
-        df['deviation'] = df['deviation'].fillna(0)
-        
-        # 买入条件：趋势向上 AND 注水力度大于抽水力度 AND 偏差小于阈值
-        buy_condition = (
-            (df['trend'] > 0) &
-            (df['f_in'] > df['f_out']) &
-            (df['deviation'].abs() < self.max_deviation)
-        )
-        df.loc[buy_condition, 'signal'] = 'BUY'
+        # 信号编码：0=WAIT, 1=BUY, 2=SELL（对应 SIGNAL_CATEGORIES）
+        codes = np.zeros(len(df), dtype=np.int8)
         
-        # 卖出条件：趋势向下 OR 抽水力度过大
-        sell_condition = (
-            (df['trend'] < 0) |
-            (df['f_out'] > df['f_in'] * 1.5)
-        )
-        df.loc[sell_condition, 'signal'] = 'SELL'
+        if not df.empty:
+            # 在 NumPy 数组上判断，NaN 按 0 处理（只在数组上填充，不修改返回的指标列）
+            trend = _nan_to_zero(df['trend'].to_numpy(dtype=np.float64))
+            f_in = _nan_to_zero(df['f_in'].to_numpy(dtype=np.float64))
+            f_out = _nan_to_zero(df['f_out'].to_numpy(dtype=np.float64))
+            deviation = _nan_to_zero(df['deviation'].to_numpy(dtype=np.float64))
+            
+            # 买入条件：趋势向上 AND 注水力度大于抽水力度 AND 偏差小于阈值
+            codes[(trend > 0) & (f_in > f_out) & (np.abs(deviation) < self.max_deviation)] = 1
+            
+            # 卖出条件：趋势向下 OR 抽水力度过大（同时满足时卖出优先）
+            codes[(trend < 0) | (f_out > f_in * 1.5)] = 2
         
-        return df
\ No newline at end of file
+        return df.assign(signal=pd.Categorical.from_codes(codes, categories=SIGNAL_CATEGORIES))
@@ -3,12 +3,21 @@ HCD (Hydro-Cost Dynamics) 策略
 基于资金能流分析的五维参数交易策略
 """
 from model.backtrader.strategy.base import BaseStrategy
-from model.backtrader.strategy.hydro_cost_dynamics.hcd_model import HCDModel
+from model.backtrader.strategy.hydro_cost_dynamics.hcd_model import HCDModel, SIGNAL_CATEGORIES
 from datetime import date
-from typing import Dict, Optional
+from typing import Any, Dict, Optional
+import numpy as np
 import pandas as pd
 
 
+# indicators_history 的数值列（每列一个 float64 数组，'signal' 另存为 SIGNAL_CATEGORIES 的 int8 编码）
+_HCD_COLUMNS = ('m_pool', 'f_in', 'f_out', 'trend', 'deviation')
+_ACCOUNT_COLUMNS = (
+    'cash', 'total_value', 'position_size', 'position_price',
+    'position_value', 'position_market_value', 'current_price',
+)
+
+
 class HCDStrategy(BaseStrategy):
     """
     HCD 量化交易策略
@@ -23,6 +32,12 @@ class HCDStrategy(BaseStrategy):
     交易信号：
     - BUY: (T_rend > 0) AND (F_in > F_out) AND (D_ev < 0.3)
     - SELL: (T_rend < 0) OR (F_out > F_in * 1.5)
+    
+    指标历史：
+    - 按列存储在 NumPy 数组中；批量分析用 get_indicators_dataframe()，
+      单个指标用 get_indicator_history()，当前日期用 get_current_indicators()
+    - indicators_history 是只读属性（不能再赋值），返回按日期的字典视图，
+      视图增量维护（只补充新写入的行），数值均为 float；请勿修改返回的字典
     """
     
     params = (
@@ -36,27 +51,104 @@ class HCDStrategy(BaseStrategy):
         
         # 初始化 HCD 模型（参数在模型内部定义）
         self.hcd_model = HCDModel()
+        # 已送入 hcd_model.update() 的触发数据源 K 线数量，以及最近一根的计算结果
+        self._hcd_bars = 0
+        self._hcd_latest: Optional[Dict[str, Any]] = None
         
-        # 五维参数历史值（按日期存储）
-        # 格式: {
-        #   日期: {
-        #     'm_pool': 值, 'f_in': 值, 'f_out': 值, 'trend': 值, 'deviation': 值, 'signal': 值,
-        #     'cash': 资金, 'total_value': 总资产, 'position_size': 持仓数量, 
-        #     'position_price': 持仓成本价, 'position_value': 持仓成本, 
-        #     'position_market_value': 持仓市值, 'current_price': 当前价格
-        #   }
-        # }
-        self.indicators_history: Dict[date, Dict[str, Optional[float]]] = {}
+        # 五维参数历史值（按列存储，每个日期一行，同一日期多次触发时覆盖该行）
+        # - _history_dates: 日期数组（datetime64[D]）
+        # - _history: {列名: float64 数组}，列见 _HCD_COLUMNS / _ACCOUNT_COLUMNS
+        # - _history_signal: 信号编码数组（int8，对应 SIGNAL_CATEGORIES）
+        # 数组按数据总长度预分配，前 _history_size 行有效
+        self._history_size = 0
+        self._history_dates = np.empty(0, dtype='datetime64[D]')
+        self._history_signal = np.empty(0, dtype=np.int8)
+        self._history: Dict[str, np.ndarray] = {
+            name: np.empty(0) for name in _HCD_COLUMNS + _ACCOUNT_COLUMNS
+        }
+        # indicators_history 的字典视图：从 _history_dirty 行起需要重新生成（之前的行已是最新）
+        self._history_view: Dict[date, Dict[str, Any]] = {}
+        self._history_dirty = 0
     
-    def get_current_indicators(self) -> Optional[Dict[str, Optional[float]]]:
+    @property
+    def indicators_history(self) -> Dict[date, Dict[str, Any]]:
+        """
+        五维参数历史值（按日期的字典视图，由列数组生成）
+        
+        格式: {
+          日期: {
+            'm_pool': 值, 'f_in': 值, 'f_out': 值, 'trend': 值, 'deviation': 值, 'signal': 值,
+            'cash': 资金, 'total_value': 总资产, 'position_size': 持仓数量, 
+            'position_price': 持仓成本价, 'position_value': 持仓成本, 
+            'position_market_value': 持仓市值, 'current_price': 当前价格
+          }
+        }
+        
+        注意:
+        - 数值均为 float；批量分析请使用 get_indicators_dataframe()
+        - 视图会被缓存并增量更新（每次访问只生成上次访问后写入的行），返回的字典请勿修改
+        """
+        size = self._history_size
+        if self._history_dirty < size:
+            dates = self._history_dates[self._history_dirty:size].tolist()
+            for row, date_key in enumerate(dates, start=self._history_dirty):
+                self._history_view[date_key] = self._history_record(row)
+            self._history_dirty = size
+        return self._history_view
+    
+    def _history_record(self, row: int) -> Dict[str, Any]:
+        """把第 row 行组装成 indicators_history 的单日字典"""
+        record: Dict[str, Any] = {name: float(self._history[name][row]) for name in _HCD_COLUMNS}
+        record['signal'] = SIGNAL_CATEGORIES[self._history_signal[row]]
+        for name in _ACCOUNT_COLUMNS:
+            record[name] = float(self._history[name][row])
+        return record
+    
+    def _history_row(self, current_date: date) -> int:
+        """
+        返回 current_date 在历史数组中的行号（新日期追加一行，容量不足时扩容）
+        """
+        size = self._history_size
+        day = np.datetime64(current_date, 'D')
+        if size > 0 and self._history_dates[size - 1] == day:
+            # 覆盖最后一行，字典视图需重新生成该行
+            self._history_dirty = min(self._history_dirty, size - 1)
+            return size - 1
+        
+        if size == len(self._history_dates):
+            # 预加载时 buflen() 即数据总长度，一次分配到位；否则按需倍增
+            capacity = max(self.data.buflen(), 2 * size, 16)
+            dates = np.empty(capacity, dtype='datetime64[D]')
+            dates[:size] = self._history_dates[:size]
+            self._history_dates = dates
+            signal = np.zeros(capacity, dtype=np.int8)
+            signal[:size] = self._history_signal[:size]
+            self._history_signal = signal
+            for name, values in self._history.items():
+                grown = np.full(capacity, np.nan)
+                grown[:size] = values[:size]
+                self._history[name] = grown
+        
+        self._history_dates[size] = day
+        self._history_size = size + 1
+        return size
+    
+    def get_current_indicators(self, current_date: Optional[date] = None) -> Optional[Dict[str, Optional[float]]]:
         """
         获取当前日期的指标值
         
+        参数:
+        - current_date: 当前日期，可选（next() 中已取得时传入，省去再次读取）
+        
         返回:
         当前日期的指标字典，如果不存在返回 None
         """
-        current_date = self.data.datetime.date(0)
-        return self.indicators_history.get(current_date)
+        if current_date is None:
+            current_date = self.get_current_date()
+        size = self._history_size
+        if size == 0 or self._history_dates[size - 1] != np.datetime64(current_date, 'D'):
+            return None
+        return self._history_record(size - 1)
     
     def get_indicator_history(self, indicator_name: str) -> Dict[date, Optional[float]]:
         """
@@ -68,10 +160,34 @@ class HCDStrategy(BaseStrategy):
         返回:
         {日期: 值} 字典
         """
-        history = {}
-        for date_key, indicators in self.indicators_history.items():
-            history[date_key] = indicators.get(indicator_name)
-        return history
+        size = self._history_size
+        dates = self._history_dates[:size].tolist()
+        if indicator_name == 'signal':
+            values = [SIGNAL_CATEGORIES[code] for code in self._history_signal[:size].tolist()]
+        elif indicator_name in self._history:
+            values = self._history[indicator_name][:size].tolist()
+        else:
+            values = [None] * size
+        return dict(zip(dates, values))
+    
+    def get_indicators_dataframe(self) -> pd.DataFrame:
+        """
+        获取五维参数历史值的 DataFrame
+        
+        返回:
+        DataFrame，索引为日期（DatetimeIndex，名称 'date'），列与 indicators_history 的字段相同，
+        'signal' 列为 Categorical（类别为 SIGNAL_CATEGORIES）
+        
+        示例:
+        df = strategy.get_indicators_dataframe()
+        df.loc[df['signal'] == 'BUY', 'deviation']
+        """
+        size = self._history_size
+        columns: Dict[str, Any] = {name: self._history[name][:size] for name in _HCD_COLUMNS}
+        columns['signal'] = pd.Categorical.from_codes(self._history_signal[:size], categories=SIGNAL_CATEGORIES)
+        for name in _ACCOUNT_COLUMNS:
+            columns[name] = self._history[name][:size]
+        return pd.DataFrame(columns, index=pd.DatetimeIndex(self._history_dates[:size], name='date'))
     
     def get_trigger_dataframe(self) -> pd.DataFrame:
         """
@@ -89,36 +205,8 @@ class HCDStrategy(BaseStrategy):
         """
         trigger_data = self.get_trigger_data()
         
-        # 如果触发数据源是主数据源，使用 get_full_dataframe()
-        if trigger_data is self.data:
-            return self.get_full_dataframe()
-        
-        # 否则，从触发数据源构建 DataFrame
-        data_list = []
-        current_idx = 0
-        
-        while current_idx < len(trigger_data.close):
-            try:
-                dt = trigger_data.datetime.datetime(-current_idx - 1)
-                data_list.append({
-                    'datetime': dt,
-                    'date': dt.date(),
-                    'open': trigger_data.open[-current_idx - 1],
-                    'high': trigger_data.high[-current_idx - 1],
-                    'low': trigger_data.low[-current_idx - 1],
-                    'close': trigger_data.close[-current_idx - 1],
-                    'volume': trigger_data.volume[-current_idx - 1],
-                })
-                current_idx += 1
-            except (IndexError, AttributeError):
-                break
-        
-        df = pd.DataFrame(data_list)
-        if not df.empty:
-            df.set_index('date', inplace=True)
-            df.sort_index(inplace=True)
-        
-        return df
+        # 一次性读取触发数据源各 line 的底层数组（与主数据源相同的构建方式）
+        return self.get_full_dataframe(trigger_data)
     
     def get_current_trigger_bar(self, df: Optional[pd.DataFrame] = None) -> Optional[Dict[str, any]]:
         """
@@ -142,57 +230,57 @@ class HCDStrategy(BaseStrategy):
         """
         trigger_data = self.get_trigger_data()
         
-        try:
-            open_price = trigger_data.open[0]
-            high_price = trigger_data.high[0]
-            low_price = trigger_data.low[0]
-            close_price = trigger_data.close[0]
-            volume = trigger_data.volume[0]
-            dt = trigger_data.datetime.datetime(0)
-            date = trigger_data.datetime.date(0)
-            
-            # 计算日内涨跌幅：(收盘 - 开盘) / 开盘 * 100
-            intraday_change_pct = ((close_price - open_price) / open_price * 100) if open_price > 0 else 0.0
-            
-            # 计算振幅：(最高 - 最低) / 开盘 * 100
-            amplitude_pct = ((high_price - low_price) / open_price * 100) if open_price > 0 else 0.0
-            
-            # 计算相对前一日涨跌幅
-            day_change_pct = None
-            if df is not None and len(df) >= 2:
-                prev_close = df.iloc[-2].get('close', 0) if 'close' in df.columns else None
-                if prev_close and prev_close > 0:
-                    day_change_pct = ((close_price - prev_close) / prev_close * 100)
-            else:
-                # 如果 DataFrame 不可用，尝试从触发数据源获取前一日数据
-                try:
-                    if len(trigger_data.close) > 1:
-                        prev_close = trigger_data.close[-2]
-                        if prev_close > 0:
-                            day_change_pct = ((close_price - prev_close) / prev_close * 100)
-                except (IndexError, AttributeError):
-                    pass
-            
-            return {
-                'datetime': dt,
-                'date': date,
-                'open': open_price,
-                'high': high_price,
-                'low': low_price,
-                'close': close_price,
-                'volume': volume,
-                'intraday_change_pct': intraday_change_pct,  # 日内涨跌幅
-                'day_change_pct': day_change_pct,  # 日涨跌幅（相对前一日）
-                'amplitude_pct': amplitude_pct,  # 振幅
-            }
-        except (IndexError, AttributeError):
+        # 触发数据源尚无 K 线时没有当前 bar
+        if len(trigger_data) == 0:
             return None
+        
+        open_price = trigger_data.open[0]
+        high_price = trigger_data.high[0]
+        low_price = trigger_data.low[0]
+        close_price = trigger_data.close[0]
+        volume = trigger_data.volume[0]
+        dt = trigger_data.datetime.datetime(0)
+        date = dt.date()
+        
+        # 计算日内涨跌幅：(收盘 - 开盘) / 开盘 * 100
+        intraday_change_pct = ((close_price - open_price) / open_price * 100) if open_price > 0 else 0.0
+        
+        # 计算振幅：(最高 - 最低) / 开盘 * 100
+        amplitude_pct = ((high_price - low_price) / open_price * 100) if open_price > 0 else 0.0
+        
+        # 计算相对前一日涨跌幅
+        day_change_pct = None
+        if df is not None and len(df) >= 2:
+            # 只读取一个标量，不构造整行 Series
+            prev_close = df['close'].iat[-2] if 'close' in df.columns else None
+            if prev_close and prev_close > 0:
+                day_change_pct = ((close_price - prev_close) / prev_close * 100)
+        else:
+            # 如果 DataFrame 不可用，从触发数据源获取前一日数据（已检查长度，不会越界）
+            if len(trigger_data.close) > 1:
+                prev_close = trigger_data.close[-1]
+                if prev_close > 0:
+                    day_change_pct = ((close_price - prev_close) / prev_close * 100)
+        
+        return {
+            'datetime': dt,
+            'date': date,
+            'open': open_price,
+            'high': high_price,
+            'low': low_price,
+            'close': close_price,
+            'volume': volume,
+            'intraday_change_pct': intraday_change_pct,  # 日内涨跌幅
+            'day_change_pct': day_change_pct,  # 日涨跌幅（相对前一日）
+            'amplitude_pct': amplitude_pct,  # 振幅
+        }
     
     def next(self):
         """策略主逻辑"""
         # 0. 检查是否应该触发（只在触发数据源更新时执行）
         if not self.should_trigger():
             return
+        current_date = self.get_current_date()
         
         # 1. 获取触发数据源的数据（根据 trigger_frequency 自动获取对应频率的数据）
         # 如果 trigger_frequency="d"，获取日线数据
@@ -204,9 +292,9 @@ class HCDStrategy(BaseStrategy):
         if df.empty:
             return
         
-        # 可选：获取当前 bar 数据（包含计算后的涨跌幅等指标）
-        current_bar = self.get_current_trigger_bar(df=df)
-        if self.params.printlog and current_bar:
+        # 可选：获取当前 bar 数据（包含计算后的涨跌幅等指标），仅在打印日志时使用
+        current_bar = self.get_current_trigger_bar(df=df) if self.params.printlog else None
+        if current_bar:
             # 格式化输出
             date_str = str(current_bar.get('date', 'N/A'))
             open_price = current_bar.get('open', 0)
@@ -243,40 +331,35 @@ class HCDStrategy(BaseStrategy):
         current_price = self.get_current_price()
         position_market_value = position_size * current_price if position_size != 0 else 0.0  # 持仓市值
         
-        # 3. 使用 hcd_model 计算五维参数
-        indicators_df = self.hcd_model.calculate_indicators(df)
-        
-        # 4. 生成交易信号
-        signals_df = self.hcd_model.generate_signals(indicators_df)
-        
-        # 安全检查：确保 signals_df 是 DataFrame
-        if signals_df is None or not isinstance(signals_df, pd.DataFrame):
-            return
+        # 3. 使用 hcd_model 计算五维参数并生成交易信号
+        # 只把上次之后新到达的触发 K 线逐根送入模型（增量更新，结果与对全部历史重新计算的最后一行相同）
+        new_bars = df.iloc[self._hcd_bars:]
+        for open_, close, volume in zip(
+            new_bars['open'].to_numpy(), new_bars['close'].to_numpy(), new_bars['volume'].to_numpy()
+        ):
+            self._hcd_latest = self.hcd_model.update(open_, close, volume)
+        self._hcd_bars = len(df)
         
-        # 5. 存储到 indicators_history（按日期存储，包含资金和持仓信息）
-        current_date = self.data.datetime.date(0)
-        if not signals_df.empty:
-            last_row = signals_df.iloc[-1]
-            self.indicators_history[current_date] = {
-                # 五维参数
-                'm_pool': last_row.get('m_pool'),
-                'f_in': last_row.get('f_in'),
-                'f_out': last_row.get('f_out'),
-                'trend': last_row.get('trend'),
-                'deviation': last_row.get('deviation'),
-                'signal': last_row.get('signal', 'WAIT'),
-                # 资金和持仓信息
-                'cash': current_cash,
-                'total_value': current_value,
-                'position_size': position_size,
-                'position_price': position_price,
-                'position_value': position_value,
-                'position_market_value': position_market_value,
-                'current_price': current_price,
-            }
+        # 4. 存储到 indicators_history（按日期存储，包含资金和持仓信息）
+        last_row = self._hcd_latest
+        if last_row is not None:
+            row = self._history_row(current_date)
+            history = self._history
+            # 五维参数
+            for name in _HCD_COLUMNS:
+                history[name][row] = last_row[name]
+            self._history_signal[row] = SIGNAL_CATEGORIES.index(last_row['signal'])
+            # 资金和持仓信息
+            history['cash'][row] = current_cash
+            history['total_value'][row] = current_value
+            history['position_size'][row] = position_size
+            history['position_price'][row] = position_price
+            history['position_value'][row] = position_value
+            history['position_market_value'][row] = position_market_value
+            history['current_price'][row] = current_price
         
-        # 6. 根据信号执行买卖操作
-        current_indicators = self.get_current_indicators()
+        # 5. 根据信号执行买卖操作
+        current_indicators = self.get_current_indicators(current_date)
         if current_indicators:
             # TODO: 根据 signal 执行买卖操作
             # signal = current_indicators.get('signal')
@@ -0,0 +1,69 @@
+"""
+Numba JIT 装饰器封装
+
+安装了 numba 时使用 numba.njit 编译数值内核；
+未安装时退化为不做任何处理的装饰器，函数按纯 Python/NumPy 执行，结果一致。
+
+numba 本身的导入耗时较长（约 0.1 秒以上），这里延迟到内核第一次被调用时才导入并编译，
+只导入回测引擎而不调用内核的进程（如 spawn 方式启动的工作进程）不承担这部分开销。
+"""
+import functools
+import importlib.util
+import types
+
+NUMBA_AVAILABLE = importlib.util.find_spec('numba') is not None
+
+# 内核中使用的 prange：编译时替换为 numba.prange，未编译时等同于 range
+prange = range
+
+
+class _LazyJit:
+    """
+    延迟编译的 numba 内核
+
+    第一次调用时导入 numba 并编译。编译前把函数引用的其他延迟内核替换为已编译的版本、
+    把 prange 替换为 numba.prange（numba 在编译时把全局变量视为常量，因此与直接使用 numba.njit 等价）
+    """
+
+    def __init__(self, func, options):
+        functools.update_wrapper(self, func)
+        self._func = func
+        self._options = options
+        self._dispatcher = None
+
+    def _compile(self):
+        if self._dispatcher is None:
+            import numba
+
+            func = self._func
+            func_globals = dict(func.__globals__)
+            for name in func.__code__.co_names:
+                value = func_globals.get(name)
+                if isinstance(value, _LazyJit) and value is not self:
+                    func_globals[name] = value._compile()
+            func_globals['prange'] = numba.prange
+
+            compiled = types.FunctionType(
+                func.__code__, func_globals, func.__name__, func.__defaults__, func.__closure__
+            )
+            compiled.__module__ = func.__module__
+            compiled.__qualname__ = func.__qualname__
+            self._dispatcher = numba.njit(**self._options)(compiled)
+        return self._dispatcher
+
+    def __call__(self, *args, **kwargs):
+        return self._compile()(*args, **kwargs)
+
+
+def njit(*args, **kwargs):
+    """numba.njit 的延迟版本，同时支持 @njit 与 @njit(cache=True) 两种写法"""
+    if len(args) == 1 and callable(args[0]) and not kwargs:
+        return _LazyJit(args[0], {}) if NUMBA_AVAILABLE else args[0]
+
+    def decorator(func):
+        return _LazyJit(func, kwargs) if NUMBA_AVAILABLE else func
+
+    return decorator
+
+
+__all__ = ['njit', 'prange', 'NUMBA_AVAILABLE']
@@ -25,9 +25,10 @@ class DataHandler:
             self.cache_dir = cache_dir
             self._initialized = True
 
-    def _get_save_dir(self, symbol: str, frequency: str) -> str:
-        """获取存储目录，不存在则创建"""
-        path = os.path.join(self.cache_dir, symbol, frequency)
+    def _get_save_dir(self, symbol: str, frequency: str, adjust_flag: str = "2") -> str:
+        """获取存储目录，不存在则创建（默认前复权存放在 {frequency} 目录，其他复权方式存放在 {frequency}_adjust{flag} 目录）"""
+        sub_dir = frequency if adjust_flag == "2" else f"{frequency}_adjust{adjust_flag}"
+        path = os.path.join(self.cache_dir, symbol, sub_dir)
         if not os.path.exists(path):
             os.makedirs(path, exist_ok=True)
         return path
@@ -58,7 +59,7 @@ class DataHandler:
         start_date_normalized = pd.to_datetime(start_date).strftime('%Y-%m-%d')
         end_date_normalized = pd.to_datetime(end_date).strftime('%Y-%m-%d')
         
-        save_dir = self._get_save_dir(symbol, frequency)
+        save_dir = self._get_save_dir(symbol, frequency, adjust_flag)
         
         # 1. 检查本地已有的日期文件
         existing_files = [f for f in os.listdir(save_dir) if f.endswith(".parquet")]
@@ -158,9 +159,11 @@ class DataHandler:
         return pd.concat(all_dfs).sort_index()
 
 
-def get_stock_data(symbol: str, start_date: str, end_date: str, frequency: str = "d") -> pd.DataFrame:
+def get_stock_data(
+    symbol: str, start_date: str, end_date: str, frequency: str = "d", adjust_flag: str = "2"
+) -> pd.DataFrame:
     dh = DataHandler()
-    return dh.get_stock_data(symbol, start_date, end_date, frequency)
+    return dh.get_stock_data(symbol, start_date, end_date, frequency, adjust_flag)
 
 if __name__ == "__main__":
     # 测试代码
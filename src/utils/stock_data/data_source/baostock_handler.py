@@ -1,7 +1,12 @@
+import threading
+
 import baostock as bs
 import pandas as pd
 from panda_python_packages import singleton
 
+# BaoStock 使用全局会话（login/logout），多线程并发查询时需要串行化
+_session_lock = threading.Lock()
+
 @singleton
 class BaoStockHandler:
     """
@@ -28,7 +33,18 @@ class BaoStockHandler:
         返回:
         - pd.DataFrame: 包含K线数据的 DataFrame
         """
-        
+        with _session_lock:
+            return self._query_history_k_data(code, start_date, end_date, frequency, adjustflag)
+
+    def _query_history_k_data(
+        self,
+        code: str,
+        start_date: str,
+        end_date: str,
+        frequency: str,
+        adjustflag: str
+    ) -> pd.DataFrame:
+        """登录、查询并登出（调用方需持有 _session_lock）"""
         # 1. 登录系统
         lg = bs.login()
         if lg.error_code != '0':
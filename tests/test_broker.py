@@ -0,0 +1,88 @@
+"""
+ChinaStockBroker 的 T+1 规则检查
+
+分钟线上逐笔下单：当天买入的股票当天不能卖出，此前交易日的持仓可以卖出，
+卖出数量超过可卖数量（总持仓 - 当天买入）时拒绝订单
+"""
+import unittest
+
+import backtrader as bt
+import numpy as np
+import pandas as pd
+
+from model.backtrader.core.broker import ChinaStockBroker
+
+
+def _make_intraday(days: int = 3, bars_per_day: int = 4) -> pd.DataFrame:
+    """days 个交易日、每日 bars_per_day 根的 5 分钟线，价格恒定"""
+    index = pd.DatetimeIndex([
+        pd.Timestamp('2024-01-02') + pd.Timedelta(days=day) + pd.Timedelta(hours=9, minutes=35 + 5 * bar)
+        for day in range(days)
+        for bar in range(bars_per_day)
+    ])
+    price = np.full(len(index), 10.0)
+    return pd.DataFrame(
+        {'open': price, 'high': price, 'low': price, 'close': price, 'volume': 1e6}, index=index
+    )
+
+
+class _ScriptedStrategy(bt.Strategy):
+    """按 K 线序号执行预设订单 {序号: ('buy' | 'sell', 数量)}，记录每笔订单的最终状态"""
+
+    params = (('actions', None),)
+
+    def __init__(self):
+        self.results = []
+
+    def next(self):
+        action = self.p.actions.get(len(self))
+        if action is not None:
+            side, size = action
+            (self.buy if side == 'buy' else self.sell)(size=size)
+
+    def notify_order(self, order):
+        if order.status in (order.Completed, order.Rejected):
+            side = 'buy' if order.isbuy() else 'sell'
+            self.results.append((side, abs(order.size), order.getstatusname()))
+
+
+def _run(actions, bars_per_day: int = 4):
+    cerebro = bt.Cerebro(stdstats=False)
+    cerebro.broker = ChinaStockBroker(commission=0.0, stamp_tax=0.0, min_commission=0.0)
+    cerebro.broker.setcash(100000.0)
+    # 收盘价成交，订单在下单的 K 线上完成
+    cerebro.broker.set_coc(True)
+    cerebro.adddata(bt.feeds.PandasData(dataname=_make_intraday(bars_per_day=bars_per_day)))
+    cerebro.addstrategy(_ScriptedStrategy, actions=actions)
+    return cerebro.run()[0].results
+
+
+class ChinaStockBrokerT1Test(unittest.TestCase):
+    """K 线序号从 1 开始，每日 4 根：第 1-4 根为第一天，第 5-8 根为第二天"""
+
+    def test_same_day_sell_is_rejected(self):
+        results = _run({1: ('buy', 100), 3: ('sell', 100)})
+        self.assertEqual(results, [('buy', 100, 'Completed'), ('sell', 100, 'Rejected')])
+
+    def test_previous_day_holdings_can_be_sold(self):
+        results = _run({1: ('buy', 100), 5: ('sell', 100)})
+        self.assertEqual(results, [('buy', 100, 'Completed'), ('sell', 100, 'Completed')])
+
+    def test_oversell_of_previous_day_holdings_is_rejected(self):
+        # 第一天买 200，第二天再买 100：第二天最多可卖 200
+        results = _run({1: ('buy', 200), 5: ('buy', 100), 6: ('sell', 300), 7: ('sell', 200)})
+        self.assertEqual(results, [
+            ('buy', 200, 'Completed'),
+            ('buy', 100, 'Completed'),
+            ('sell', 300, 'Rejected'),
+            ('sell', 200, 'Completed'),
+        ])
+
+    def test_shares_bought_yesterday_become_sellable_next_day(self):
+        # 第二天买入的 100 股在第三天可以卖出
+        results = _run({1: ('buy', 100), 5: ('buy', 100), 9: ('sell', 200)})
+        self.assertEqual(results[-1], ('sell', 200, 'Completed'))
+
+
+if __name__ == '__main__':
+    unittest.main()
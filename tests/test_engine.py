@@ -0,0 +1,69 @@
+"""
+BacktestEngine 共享内存数据缓存的检查
+
+attach_shared_cache() 后，引擎随 run_many() 序列化时只能携带共享内存描述，
+不能再复制一份主数据源（触发频率）的数据
+"""
+import pickle
+import unittest
+
+import backtrader as bt
+import numpy as np
+import pandas as pd
+
+from model.backtrader.core.engine import BacktestEngine
+from model.backtrader.core.shared_cache import publish_frames
+
+
+class _BuyOnceStrategy(bt.Strategy):
+    """第一根 K 线买入 100 股并一直持有"""
+
+    def next(self):
+        if not self.position:
+            self.buy(size=100)
+
+
+def _make_frames(n: int = 20_000):
+    """{'5': 5 分钟线, 'd': 日线}，收盘价为随机游走"""
+    rng = np.random.default_rng(0)
+    close = 20 * np.exp(np.cumsum(rng.normal(0, 0.002, n)))
+    df = pd.DataFrame(
+        {'open': close, 'high': close * 1.001, 'low': close * 0.999, 'close': close, 'volume': 1e5},
+        index=pd.date_range('2020-01-01', periods=n, freq='5min'),
+    )
+    return {'5': df, 'd': df.iloc[::48]}
+
+
+class SharedCacheEngineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.frames = _make_frames()
+        self.cache = publish_frames(
+            self.frames, symbol='000651', start_date='2020-01-01', end_date='2020-12-31', frequencies=['5', 'd']
+        )
+        self.addCleanup(self.cache.release)
+
+    def _attached_engine(self) -> BacktestEngine:
+        engine = BacktestEngine(trigger_frequency='5', min_commission=0.0)
+        engine.attach_shared_cache(self.cache.spec)
+        engine.add_strategy(_BuyOnceStrategy)
+        return engine
+
+    def test_pickled_engine_does_not_copy_main_data(self):
+        payload = pickle.dumps(self._attached_engine())
+        # 主数据源 5 分钟线约 0.8 MB，序列化后的引擎只应包含描述信息
+        self.assertLess(len(payload), self.frames['5'].memory_usage().sum() // 20)
+
+    def test_pickled_engine_runs_like_local_engine(self):
+        local = self._attached_engine().run()
+        restored = pickle.loads(pickle.dumps(self._attached_engine())).run()
+        self.assertEqual(restored['final_value'], local['final_value'])
+
+        direct = BacktestEngine(trigger_frequency='5', min_commission=0.0)
+        direct.add_data(df=self.frames['5'], name='000651_5', is_main=True)
+        direct.add_strategy(_BuyOnceStrategy)
+        self.assertEqual(direct.run()['final_value'], local['final_value'])
+
+
+if __name__ == '__main__':
+    unittest.main()
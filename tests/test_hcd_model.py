@@ -0,0 +1,90 @@
+"""
+HCDModel 指标计算的回归检查
+
+以最初的 pandas 逐列实现（rolling().mean() / rolling().sum()）为参照，
+重点覆盖停牌等窗口内成交量全为 0 的区间
+"""
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from model.backtrader.strategy.hydro_cost_dynamics.hcd_model import HCDModel, _INDICATOR_COLUMNS
+
+
+def _make_suspended_series(seed: int, n: int = 300, suspended: int = 40) -> pd.DataFrame:
+    """随机行情，中间 suspended 根 K 线停牌（成交量为 0，开盘 = 收盘 = 停牌前收盘价）"""
+    rng = np.random.default_rng(seed)
+    close = 20 * np.exp(np.cumsum(rng.normal(0, 0.02, n)))
+    open_ = close * np.exp(rng.normal(0, 0.01, n))
+    volume = rng.integers(10_000, 1_000_000, n).astype(np.float64)
+    start = int(rng.integers(50, n - suspended - 10))
+    stop = start + suspended
+    volume[start:stop] = 0.0
+    open_[start:stop] = close[start - 1]
+    close[start:stop] = close[start - 1]
+    return pd.DataFrame({'open': open_, 'high': close, 'low': close, 'close': close, 'volume': volume})
+
+
+def _pandas_reference(df: pd.DataFrame, model: HCDModel) -> pd.DataFrame:
+    """f_in / f_out / vwap / deviation 与信号的 pandas 参照实现"""
+    window = model.window
+    mef = df['volume'] * (df['close'] - df['open']) / df['open']
+    flow_in = mef.where(mef > 0, 0)
+    flow_out = mef.where(mef < 0, 0)
+    result = pd.DataFrame({
+        'f_in': flow_in.rolling(window=window, min_periods=1).mean(),
+        'f_out': (-flow_out).rolling(window=window, min_periods=1).mean(),
+        'vwap': (df['close'] * df['volume']).rolling(window=window, min_periods=1).sum()
+        / df['volume'].rolling(window=window, min_periods=1).sum(),
+    })
+    result['deviation'] = (df['close'] - result['vwap']) / result['vwap']
+    return result
+
+
+class HCDModelZeroVolumeTest(unittest.TestCase):
+    """窗口内成交量全为 0 时，窗口和必须精确为 0（不能残留舍入误差）"""
+
+    def test_suspended_window_matches_pandas(self):
+        model = HCDModel()
+        for seed in range(20):
+            df = _make_suspended_series(seed)
+            result = model.generate_signals(model.calculate_indicators(df))
+            expected = _pandas_reference(df, model)
+
+            # 整个窗口都在停牌区间内的 K 线：注水/抽水力度精确为 0，VWAP 为 0/0 = NaN
+            all_zero = (df['volume'].rolling(model.window).max() == 0).to_numpy()
+            self.assertTrue(all_zero.any())
+            self.assertTrue((result['f_in'].to_numpy()[all_zero] == 0).all())
+            self.assertTrue((result['f_out'].to_numpy()[all_zero] == 0).all())
+            self.assertTrue(np.isnan(result['deviation'].to_numpy()[all_zero]).all())
+
+            for name in ('f_in', 'f_out', 'vwap', 'deviation'):
+                np.testing.assert_allclose(
+                    result[name].to_numpy(), expected[name].to_numpy(), rtol=1e-9, atol=1e-9, err_msg=name
+                )
+
+    def test_numpy_fallback_matches_kernel(self):
+        model = HCDModel()
+        df = _make_suspended_series(0)
+        result = model.calculate_indicators(df)
+        columns = model._calculate_columns(
+            df['open'].to_numpy(), df['close'].to_numpy(), df['volume'].to_numpy()
+        )
+        for name, values in zip(_INDICATOR_COLUMNS, columns):
+            np.testing.assert_allclose(result[name].to_numpy(), values, rtol=1e-9, atol=1e-6, err_msg=name)
+
+    def test_update_matches_calculate_indicators(self):
+        model = HCDModel()
+        df = _make_suspended_series(15)
+        expected = model.generate_signals(model.calculate_indicators(df))
+
+        model.reset()
+        rows = [model.update(o, c, v) for o, c, v in zip(df['open'], df['close'], df['volume'])]
+        for name in _INDICATOR_COLUMNS:
+            np.testing.assert_array_equal(np.array([row[name] for row in rows]), expected[name].to_numpy())
+        self.assertEqual([row['signal'] for row in rows], expected['signal'].astype(str).tolist())
+
+
+if __name__ == '__main__':
+    unittest.main()